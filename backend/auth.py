@@ -1,58 +1,195 @@
+import base64
+import binascii
+import hashlib
+import hmac
 import os
+import secrets
+import time
 from datetime import datetime, timedelta
-from typing import Any, Union
-from jose import JWTError, jwt
+from typing import Any, Optional, Tuple, Union
+import orjson
+from bson import ObjectId
+from bson.errors import InvalidId
+from jose import jwt
 from passlib.context import CryptContext
-from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, status
+import settings  # noqa: F401  loads .env
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database import user_collection
-
-load_dotenv()
+from cache import user_cache, TTLCache
+from hashing import hash_pool
+from revocation import revocations
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-goes-here-make-it-long-and-random-1234567890")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+# Stream tokens only open event streams. EventSource can only send them in
+# the URL, where proxies and access logs keep them, so they expire quickly.
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("STREAM_TOKEN_EXPIRE_SECONDS", 60))
+# Tokens whose signature has already been checked, keyed by the token string
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", 10000))
+# Changing this rehashes each user's password on their next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
 
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 security = HTTPBearer()
 
+# HMAC state for the secret is built once and copied per verification
+_signing_key = hmac.new(SECRET_KEY.encode(), digestmod=hashlib.sha256)
+verified_tokens = TTLCache(VERIFIED_TOKEN_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
 def get_hashed_password(password: str) -> str:
     return password_context.hash(password)
 
 def verify_password(password: str, hashed_pass: str) -> bool:
     return password_context.verify(password, hashed_pass)
 
-def create_access_token(subject: Union[str, Any], expires_delta: int = None) -> str:
+def verify_and_update_password(password: str, hashed_pass: str) -> Tuple[bool, Optional[str]]:
+    # Returns a new hash alongside a valid result when the stored cost is outdated
+    return password_context.verify_and_update(password, hashed_pass)
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run(get_hashed_password, password)
+
+async def verify_password_async(password: str, hashed_pass: str) -> Tuple[bool, Optional[str]]:
+    return await hash_pool.run(verify_and_update_password, password, hashed_pass)
+
+def create_access_token(
+    subject: Union[str, Any],
+    expires_delta: timedelta = None,
+    claims: Optional[dict] = None,
+    token_type: str = "access"
+) -> str:
+    now = datetime.utcnow()
     if expires_delta is not None:
-        expires_delta = datetime.utcnow() + expires_delta
+        expires_delta = now + expires_delta
     else:
-        expires_delta = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode = {"exp": expires_delta, "sub": str(subject)}
+    to_encode = {
+        "exp": expires_delta,
+        "iat": now,
+        "sub": str(subject),
+        "jti": secrets.token_urlsafe(12),
+        "typ": token_type,
+        **(claims or {})
+    }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
+def create_token_pair(user: dict) -> dict:
+    # The access token carries what routes need to authorize a request, so
+    # get_current_user can answer without reading Mongo
+    claims = {"uid": str(user["_id"]), "role": user.get("role", "user")}
+    return {
+        "access_token": create_access_token(user["email"], claims=claims),
+        "refresh_token": create_access_token(
+            user["email"], timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), {"uid": claims["uid"]}, "refresh"
+        ),
+        "token_type": "bearer"
+    }
+
+def create_stream_token(user: dict, claims: dict) -> str:
+    # sid is the access token the stream token was issued for, so revoking
+    # that token also ends the streams opened with it
+    return create_access_token(
+        user["email"],
+        timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS),
+        {"uid": str(user["_id"]), "role": user.get("role", "user"), "sid": claims.get("jti")},
+        "stream"
+    )
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def _verify_signature(token: str) -> Optional[dict]:
+    # HS256 verification without python-jose's per-call key handling
+    try:
+        signing_input, _, signature = token.rpartition(".")
+        header_segment, _, payload_segment = signing_input.partition(".")
+        if orjson.loads(_b64decode(header_segment)).get("alg") != ALGORITHM:
+            return None
+        mac = _signing_key.copy()
+        mac.update(signing_input.encode())
+        if not hmac.compare_digest(mac.digest(), _b64decode(signature)):
+            return None
+        claims = orjson.loads(_b64decode(payload_segment))
+    except (ValueError, binascii.Error, AttributeError):
+        return None
+    if not isinstance(claims, dict) or not isinstance(claims.get("exp"), (int, float)):
+        return None
+    return claims
+
+def decode_token(token: str) -> Optional[dict]:
+    # Claims of a validly signed, unexpired token, or None
+    claims = verified_tokens.get(token)
+    if claims is None:
+        claims = _verify_signature(token)
+        if claims is None:
+            return None
+        verified_tokens.set(token, claims)
+    if claims["exp"] <= time.time():
+        return None
+    return claims
+
+def token_expiry(claims: dict) -> datetime:
+    return datetime.utcfromtimestamp(claims["exp"])
+
+async def authenticate_token(token: str, token_type: str = "access"):
+    # Returns (user, claims) for a valid, unrevoked token of the given type
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    claims = decode_token(token)
+    if claims is None or claims.get("typ", "access") != token_type or revocations.is_revoked(claims):
         raise credentials_exception
-    
-    user = await user_collection.find_one({"email": email})
-    if user is None:
+    email = claims.get("sub")
+    if email is None:
         raise credentials_exception
+
+    if "uid" in claims and "role" in claims:
+        # Principal built from the claims: routes only use _id, email and role
+        try:
+            return {"_id": ObjectId(claims["uid"]), "email": email, "role": claims["role"]}, claims
+        except (InvalidId, TypeError):
+            raise credentials_exception
+
+    # Tokens issued before claims were added are resolved from the database
+    user = user_cache.get(email)
+    if user is None:
+        user = await user_collection.find_one({"email": email})
+        if user is None:
+            raise credentials_exception
+        user_cache.set(email, user)
+    return user, claims
+
+async def get_user_from_token(token: str):
+    user, _ = await authenticate_token(token)
     return user
 
+async def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
+    return await get_user_from_token(token.credentials)
+
+async def get_stream_session(
+    token: Optional[str] = Query(None, description="Stream token from POST /events/token, for clients such as EventSource that cannot set headers"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+):
+    # (user, claims); the stream re-checks the claims against revocations
+    if credentials is not None:
+        return await authenticate_token(credentials.credentials)
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Access tokens are not accepted in the URL
+    return await authenticate_token(token, "stream")
+
 async def get_admin_user(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "admin":
         raise HTTPException(
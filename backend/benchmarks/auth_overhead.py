@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from jose import jwt
+
+from auth import (
+    ALGORITHM, SECRET_KEY, create_access_token, create_token_pair, decode_token, get_user_from_token,
+    verified_tokens, _verify_signature
+)
+from cache import user_cache
+
+# Run from the backend directory; no database needed:
+#   python -m benchmarks.auth_overhead --iterations 100000
+# The legacy path is timed with the user already in the cache, its best case.
+
+
+def make_user():
+    return {
+        "_id": ObjectId(),
+        "fullname": "Bench User",
+        "email": "auth-bench@example.com",
+        "password": "$2b$12$" + "x" * 53,
+        "role": "user",
+        "created_at": datetime.utcnow()
+    }
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def measure_async(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main(iterations):
+    user = make_user()
+    legacy_token = create_access_token(user["email"])
+    claims_token = create_token_pair(user)["access_token"]
+    user_cache.set(user["email"], user)
+
+    def uncached_decode():
+        verified_tokens.clear()
+        return decode_token(claims_token)
+
+    results = [
+        ("jose jwt.decode", measure(lambda: jwt.decode(claims_token, SECRET_KEY, algorithms=[ALGORITHM]), iterations)),
+        ("hmac signature check", measure(lambda: _verify_signature(claims_token), iterations)),
+        ("decode_token, cache miss", measure(uncached_decode, iterations)),
+        ("decode_token, cache hit", measure(lambda: decode_token(claims_token), iterations)),
+        ("legacy token -> user", await measure_async(lambda: get_user_from_token(legacy_token), iterations)),
+        ("claims token -> user", await measure_async(lambda: get_user_from_token(claims_token), iterations)),
+    ]
+
+    print(f"Per-request token cost over {iterations} iterations")
+    print(f"{'step':>26} | {'us/op':>8}")
+    print("-" * 38)
+    for label, micros in results:
+        print(f"{label:>26} | {micros:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time JWT verification and principal lookup")
+    parser.add_argument("--iterations", type=int, default=100000)
+    asyncio.run(main(parser.parse_args().iterations))
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import os
+import time
+
+# Run from the backend directory against a replica set; a single local node
+# is enough:
+#   mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+#   mongosh --eval 'rs.initiate()'
+#   MONGO_DETAILS="mongodb://localhost:27017/?replicaSet=rs0" python -m benchmarks.bus_latency
+# Two buses stand in for two workers: one publishes, the other reports how
+# long each message took to arrive.
+os.environ.setdefault("MONGO_DATABASE", "task_manager_bench")
+
+from bus import InvalidationBus, bus_collection  # noqa: E402
+from database import database  # noqa: E402
+from migrations import create_invalidation_bus  # noqa: E402
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def main(args):
+    await create_invalidation_bus(database)
+    sender = InvalidationBus(bus_collection, enabled=True)
+    receiver = InvalidationBus(bus_collection, enabled=True)
+    latencies = []
+    received = asyncio.Event()
+
+    def on_message(data):
+        latencies.append((time.time() - data["sent"]) * 1000)
+        if len(latencies) >= args.messages:
+            received.set()
+
+    receiver.subscribe("bench", on_message)
+    if not await sender.open() or not await receiver.open():
+        raise SystemExit("Change streams are not available; start mongod as a replica set")
+    tasks = [asyncio.create_task(sender.run()), asyncio.create_task(receiver.run())]
+
+    interval = 1 / args.rate
+    for i in range(args.messages):
+        sender.publish("bench", {"sent": time.time(), "seq": i})
+        await asyncio.sleep(interval)
+    try:
+        await asyncio.wait_for(received.wait(), 10)
+    except asyncio.TimeoutError:
+        pass
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"{len(latencies)}/{args.messages} messages delivered at {args.rate:g}/s")
+    print(f"p50 {percentile(latencies, 50):.1f}ms | p99 {percentile(latencies, 99):.1f}ms | max {max(latencies, default=0):.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure publish-to-delivery latency of the invalidation bus")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="Messages per second")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Run from the backend directory:
+#   python -m benchmarks.cold_start --runs 10
+# Each run starts a fresh interpreter. "import" is the time to import main,
+# "ready" the time from spawning uvicorn until /health/ready answers 200,
+# which needs a reachable MONGO_DETAILS; use --import-only without one.
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_ready(timeout):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() - start < timeout:
+                if server.poll() is not None:
+                    raise SystemExit(f"uvicorn exited during startup:\n{server.stderr.read().decode()}")
+                try:
+                    if client.get("/health/ready").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise SystemExit(f"Not ready after {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(label, samples):
+    samples_ms = [s * 1000 for s in samples]
+    print(
+        f"{label:>8} | {statistics.median(samples_ms):>8.0f} | "
+        f"{min(samples_ms):>8.0f} | {max(samples_ms):>8.0f}"
+    )
+
+
+def main(args):
+    # Workers in the measured runs should not start outbound work
+    os.environ.setdefault("EMAIL_DISPATCHER_IN_APP", "false")
+    os.environ.setdefault("SCHEDULER_IN_APP", "false")
+    results = [("import", [time_import() for _ in range(args.runs)])]
+    if not args.import_only:
+        results.append(("ready", [time_ready(args.timeout) for _ in range(args.runs)]))
+
+    print(f"Cold start over {args.runs} runs")
+    print(f"{'phase':>8} | {'p50 ms':>8} | {'min ms':>8} | {'max ms':>8}")
+    print("-" * 42)
+    for label, samples in results:
+        summarize(label, samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure worker cold-start time")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--import-only", action="store_true", help="Skip the uvicorn runs, which need Mongo")
+    main(parser.parse_args())
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Run from the backend directory. Results are written as JSON so runs on two
+# commits can be compared:
+#   python -m benchmarks.load_test --dataset 100k --output before.json
+#   python -m benchmarks.load_test --dataset 100k --output after.json --compare before.json
+# The app is driven in-process over ASGI, against an in-memory mongomock
+# database by default or, with --backend mongo, the task_manager_bench
+# database on the server given by --mongo-url. MONGO_DETAILS and
+# MONGO_DATABASE from the environment or .env are never used: seeding wipes
+# the database.
+
+# dataset -> (tasks, users)
+DATASETS = {
+    "1k": (1_000, 100),
+    "100k": (100_000, 5_000),
+    "1m": (1_000_000, 20_000),
+}
+WORKLOADS = ["login", "dashboard", "bulk_status"]
+BENCH_PASSWORD = "bench-password"
+BENCH_ADMIN_EMAIL = "bench-admin@example.com"
+BENCH_DATABASE = "task_manager_bench"
+SEED_BATCH_SIZE = 10_000
+BULK_UPDATE_SIZE = 100
+STATUSES = ["pending", "in_progress", "completed"]
+PRIORITIES = ["low", "medium", "high"]
+
+
+def configure_backend(backend, mongo_url=None):
+    # Must run before any app module is imported: modules read their
+    # settings at import time
+    os.environ["MONGO_DATABASE"] = BENCH_DATABASE
+    # Outbound email is not part of the measured path
+    os.environ["EMAIL_DISPATCHER_IN_APP"] = "false"
+    # Every simulated client shares one address; benchmarks/overload.py
+    # covers the limiter
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    if backend == "mongo":
+        if not mongo_url:
+            raise ValueError("--backend mongo needs an explicit --mongo-url")
+        os.environ["MONGO_DETAILS"] = mongo_url
+    elif backend == "mock":
+        # Never resolve a real cluster from .env for the in-memory database
+        os.environ["MONGO_DETAILS"] = "mongodb://localhost:27017"
+        # mongomock has no replicas, and its collections lose their async
+        # wrapper when copied with other read preferences
+        os.environ["MONGO_ANALYTICS_READ_PREFERENCE"] = "primary"
+        import motor.motor_asyncio
+        from mongomock.collection import BulkOperationBuilder
+        from mongomock.database import Database
+        from mongomock_motor import AsyncMongoMockClient
+        from pymongo.errors import OperationFailure
+
+        # mongomock 4.3 predates the sort argument newer pymongo passes to
+        # bulk updates
+        add_update, add_replace = BulkOperationBuilder.add_update, BulkOperationBuilder.add_replace
+        BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+        BulkOperationBuilder.add_replace = lambda self, *args, sort=None, **kwargs: add_replace(self, *args, **kwargs)
+        # mongomock cannot create time series or capped collections. Time
+        # series fail the way they do on a server older than 5.0, so
+        # migrations take their fallback. Capped collections are created
+        # uncapped; they back the invalidation bus, which stays off without
+        # change streams anyway.
+        create_collection = Database.create_collection
+
+        def create_plain_collection(self, name, timeseries=None, capped=False, size=None, **kwargs):
+            if timeseries is not None:
+                raise OperationFailure("Time series collections are not supported", code=72)
+            return create_collection(self, name, **kwargs)
+
+        Database.create_collection = create_plain_collection
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+
+async def seed(database, task_count, user_count, reseed):
+    from auth import get_hashed_password
+    from queries import user_search_terms
+
+    # Seeding empties users and tasks
+    if not database.name.endswith("_bench"):
+        raise RuntimeError(f"Refusing to seed {database.name}: benchmark databases end in _bench")
+
+    meta = database.get_collection("bench_meta")
+    users = database.get_collection("users")
+    tasks = database.get_collection("tasks")
+    dataset = {"_id": "dataset", "tasks": task_count, "users": user_count}
+    if not reseed and await meta.find_one(dataset):
+        print(f"Reusing seeded dataset: {task_count} tasks, {user_count} users")
+        return
+
+    print(f"Seeding {task_count} tasks and {user_count} users...")
+    start = time.perf_counter()
+    await meta.delete_many({})
+    await users.delete_many({})
+    await tasks.delete_many({})
+
+    # One hash shared by every user; bcrypt per user would dominate seeding
+    password = get_hashed_password(BENCH_PASSWORD)
+    now = datetime.utcnow()
+    await users.insert_one({
+        "fullname": "Bench Admin",
+        "email": BENCH_ADMIN_EMAIL,
+        "password": password,
+        "role": "admin",
+        "search_terms": user_search_terms("Bench Admin", BENCH_ADMIN_EMAIL),
+        "created_at": now
+    })
+    user_ids = []
+    for offset in range(0, user_count, SEED_BATCH_SIZE):
+        result = await users.insert_many([
+            {
+                "fullname": f"Bench User {i}",
+                "email": f"bench{i}@example.com",
+                "password": password,
+                "role": "user",
+                "search_terms": user_search_terms(f"Bench User {i}", f"bench{i}@example.com"),
+                "created_at": now
+            }
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, user_count))
+        ])
+        user_ids.extend(result.inserted_ids)
+
+    rng = random.Random(42)
+    today = datetime.combine(now.date(), datetime.min.time())
+    for offset in range(0, task_count, SEED_BATCH_SIZE):
+        await tasks.insert_many([
+            {
+                "title": f"Task {i}",
+                "description": "Synthetic benchmark task with a description of typical length.",
+                "assigned_to": user_ids[i % user_count],
+                "assignee": {"fullname": f"Bench User {i % user_count}", "email": f"bench{i % user_count}@example.com"},
+                "due_date": today + timedelta(days=rng.randint(-30, 60)),
+                "status": rng.choice(STATUSES),
+                "priority": rng.choice(PRIORITIES),
+                "created_at": now - timedelta(minutes=i)
+            }
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, task_count))
+        ])
+
+    await meta.insert_one(dataset)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, client, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(endpoint, []).append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return response
+
+
+async def login_worker(client, recorder, deadline, user_count):
+    while time.perf_counter() < deadline:
+        email = f"bench{random.randrange(user_count)}@example.com"
+        await recorder.request(client, "POST /auth/login", "POST", "/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+
+
+async def dashboard_worker(client, recorder, deadline, user_tokens, admin_headers, is_admin):
+    # Admin dashboards poll stats and the task grid, user dashboards their tasks
+    while time.perf_counter() < deadline:
+        if is_admin:
+            await recorder.request(client, "GET /tasks/stats", "GET", "/tasks/stats", headers=admin_headers)
+            await recorder.request(client, "GET /tasks/", "GET", "/tasks/", params={"limit": 50}, headers=admin_headers)
+        else:
+            headers = {"Authorization": f"Bearer {random.choice(user_tokens)}"}
+            await recorder.request(client, "GET /tasks/my", "GET", "/tasks/my", params={"limit": 50}, headers=headers)
+
+
+async def bulk_status_worker(client, recorder, deadline, task_ids, admin_headers):
+    while time.perf_counter() < deadline:
+        updates = [
+            {"task_id": task_id, "status": random.choice(STATUSES)}
+            for task_id in random.sample(task_ids, min(BULK_UPDATE_SIZE, len(task_ids)))
+        ]
+        await recorder.request(client, "PUT /tasks/status/bulk", "PUT", "/tasks/status/bulk", json=updates, headers=admin_headers)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(workload, recorder, duration):
+    return [
+        {
+            "workload": workload,
+            "endpoint": endpoint,
+            "requests": len(latencies),
+            "errors": recorder.errors.get(endpoint, 0),
+            "throughput_rps": round(len(latencies) / duration, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(max(latencies), 2)
+        }
+        for endpoint, latencies in sorted(recorder.latencies.items())
+    ]
+
+
+async def run_workload(app, workload, args, user_count, task_ids, principals):
+    import httpx
+    from auth import create_token_pair
+
+    # Tokens as issued by /auth/login, carrying the id and role claims
+    admin_headers = {"Authorization": f"Bearer {create_token_pair(principals[0])['access_token']}"}
+    user_tokens = [create_token_pair(user)["access_token"] for user in principals[1:]]
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        deadline = time.perf_counter() + args.duration
+        if workload == "login":
+            workers = [login_worker(client, recorder, deadline, user_count) for _ in range(args.concurrency)]
+        elif workload == "dashboard":
+            workers = [
+                dashboard_worker(client, recorder, deadline, user_tokens, admin_headers, is_admin=i % 4 == 0)
+                for i in range(args.concurrency)
+            ]
+        else:
+            workers = [bulk_status_worker(client, recorder, deadline, task_ids, admin_headers) for _ in range(args.concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - start
+    return summarize(workload, recorder, elapsed)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'workload':>12} | {'endpoint':<22} | {'reqs':>7} | {'errs':>5} | {'req/s':>8} | {'p50':>8} | {'p95':>8} | {'p99':>8}")
+    print("-" * 98)
+    for r in results:
+        print(
+            f"{r['workload']:>12} | {r['endpoint']:<22} | {r['requests']:>7} | {r['errors']:>5} | "
+            f"{r['throughput_rps']:>8.1f} | {r['p50_ms']:>8.1f} | {r['p95_ms']:>8.1f} | {r['p99_ms']:>8.1f}"
+        )
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["workload"], r["endpoint"]): r for r in baseline["results"]}
+    print(f"\nChange against {baseline_path} (commit {baseline['meta'].get('commit')}); negative latency is better")
+    print(f"{'workload':>12} | {'endpoint':<22} | {'req/s':>8} | {'p50':>8} | {'p95':>8} | {'p99':>8}")
+    print("-" * 80)
+    for r in results:
+        before = previous.get((r["workload"], r["endpoint"]))
+        if before is None:
+            continue
+
+        def delta(key):
+            return f"{(r[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else "n/a"
+
+        print(
+            f"{r['workload']:>12} | {r['endpoint']:<22} | {delta('throughput_rps'):>8} | "
+            f"{delta('p50_ms'):>8} | {delta('p95_ms'):>8} | {delta('p99_ms'):>8}"
+        )
+
+
+async def main(args):
+    configure_backend(args.backend, args.mongo_url)
+
+    import database
+    import stats
+    from main import app
+    from migrations import apply_migrations
+
+    task_count, user_count = DATASETS[args.dataset]
+    await apply_migrations(database.database)
+    await seed(database.database, task_count, user_count, args.reseed)
+    await stats.reconcile()
+    task_ids = [str(task["_id"]) async for task in database.task_collection.find({}, {"_id": 1}).limit(10_000)]
+    principals = [await database.user_collection.find_one({"email": BENCH_ADMIN_EMAIL}, {"email": 1, "role": 1})]
+    principals += [user async for user in database.user_collection.find({"role": "user"}, {"email": 1, "role": 1}).limit(10_000)]
+
+    results = []
+    for workload in args.workloads:
+        print(f"Running {workload} for {args.duration}s with {args.concurrency} clients...")
+        results.extend(await run_workload(app, workload, args, user_count, task_ids, principals))
+
+    print_results(results)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "dataset": args.dataset,
+            "tasks": task_count,
+            "users": user_count,
+            "backend": args.backend,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "python": sys.version.split()[0],
+            "platform": platform.platform()
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run concurrent API workloads against a synthetic dataset")
+    parser.add_argument("--dataset", choices=list(DATASETS), default="1k")
+    parser.add_argument("--backend", choices=["mongo", "mock"], default="mock")
+    parser.add_argument("--mongo-url", help="Server for --backend mongo; the benchmark never reads MONGO_DETAILS")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--reseed", action="store_true", help="Regenerate the dataset even if it is already seeded")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    args = parser.parse_args()
+    if args.backend == "mongo" and not args.mongo_url:
+        parser.error("--backend mongo needs an explicit --mongo-url")
+    asyncio.run(main(args))
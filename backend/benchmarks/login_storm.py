@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import httpx
+
+import auth
+from auth import create_access_token, get_hashed_password
+from database import user_collection
+from hashing import HashPool, PASSWORD_HASH_WORKERS
+from main import app
+from ratelimit import limiter
+
+# Run from the backend directory against the configured MONGO_DETAILS:
+#   python -m benchmarks.login_storm --duration 10 --loginers 32
+BENCH_EMAIL = "login-storm-bench@example.com"
+BENCH_PASSWORD = "bench-password"
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def login_loop(client, deadline, counts):
+    while time.perf_counter() < deadline:
+        response = await client.post("/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        await asyncio.sleep(0)
+
+
+async def poll_loop(client, headers, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get("/tasks/my", headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run_mode(label, pool, duration, loginers, pollers):
+    auth.hash_pool = pool
+    headers = {"Authorization": f"Bearer {create_access_token(BENCH_EMAIL)}"}
+    latencies = []
+    counts = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(login_loop(client, deadline, counts) for _ in range(loginers)),
+            *(poll_loop(client, headers, deadline, latencies) for _ in range(pollers))
+        )
+    pool.shutdown()
+
+    print(
+        f"{label:>8} | {len(latencies):>6} | {percentile(latencies, 50):>8.1f} | "
+        f"{percentile(latencies, 95):>8.1f} | {percentile(latencies, 99):>8.1f} | "
+        f"{counts.get(200, 0) / duration:>8.1f} | {counts.get(503, 0):>5}"
+    )
+
+
+async def main(duration, loginers, pollers, workers):
+    # Measures the hash pool, not the per-client login limit
+    limiter.enabled = False
+    await user_collection.delete_one({"email": BENCH_EMAIL})
+    await user_collection.insert_one({
+        "fullname": "Login Storm Bench",
+        "email": BENCH_EMAIL,
+        "password": get_hashed_password(BENCH_PASSWORD),
+        "role": "user",
+        "created_at": datetime.utcnow()
+    })
+
+    print(f"/tasks/my latency (ms) under {loginers} concurrent logins for {duration}s each")
+    print(f"{'mode':>8} | {'polls':>6} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'logins/s':>8} | {'503s':>5}")
+    print("-" * 70)
+    try:
+        await run_mode("inline", HashPool(0), duration, loginers, pollers)
+        await run_mode("pooled", HashPool(workers, max_queue=loginers), duration, loginers, pollers)
+    finally:
+        await user_collection.delete_one({"email": BENCH_EMAIL})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /tasks/my latency during a login storm")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--loginers", type=int, default=32)
+    parser.add_argument("--pollers", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS or 4)
+    args = parser.parse_args()
+    asyncio.run(main(args.duration, args.loginers, args.pollers, args.workers))
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from ratelimit import RateLimiter, RateLimitMiddleware, MemoryBuckets
+
+# Run from the backend directory; no database needed:
+#   python -m benchmarks.overload --rate 300 --abusive-rate 500 --duration 10
+# A stand-in handler holds one of --capacity slots (the Mongo pool) for
+# --service-ms, so offered load beyond capacity queues the way real routes
+# queue on connection checkout. Each scenario reports latency of the requests
+# that were served and how many were turned away.
+
+ABUSIVE_ADDRESS = "10.9.9.9"
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def build_app(capacity, service_ms):
+    slots = asyncio.Semaphore(capacity)
+
+    async def work(request):
+        async with slots:
+            await asyncio.sleep(service_ms / 1000)
+        return JSONResponse({"ok": True})
+
+    return Starlette(routes=[Route("/tasks/", work)])
+
+
+async def request(client, address, latencies, counts):
+    start = time.perf_counter()
+    response = await client.get("/tasks/")
+    elapsed = (time.perf_counter() - start) * 1000
+    counts[response.status_code] = counts.get(response.status_code, 0) + 1
+    if response.status_code == 200 and address != ABUSIVE_ADDRESS:
+        latencies.append(elapsed)
+
+
+async def run_scenario(label, app, rate, abusive_rate, duration):
+    # Open loop: requests arrive on schedule whether or not earlier ones have
+    # finished, like independent users. Well-behaved traffic is spread over
+    # many addresses, abusive traffic comes from one.
+    latencies = []
+    counts = {}
+    clients = {}
+    pending = []
+    total_rate = rate + abusive_rate
+    interval = 1 / total_rate
+    start = time.perf_counter()
+    for i in range(int(total_rate * duration)):
+        address = ABUSIVE_ADDRESS if random.random() < abusive_rate / total_rate else f"10.0.0.{i % 200}"
+        if address not in clients:
+            transport = httpx.ASGITransport(app=app, client=(address, 50000))
+            clients[address] = httpx.AsyncClient(transport=transport, base_url="http://bench")
+        pending.append(asyncio.create_task(request(clients[address], address, latencies, counts)))
+        delay = start + (i + 1) * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    await asyncio.gather(*pending)
+    for client in clients.values():
+        await client.aclose()
+
+    print(
+        f"{label:>22} | {len(latencies) / duration:>8.1f} | {percentile(latencies, 50):>7.1f} | "
+        f"{percentile(latencies, 99):>7.1f} | {max(latencies, default=0):>7.1f} | "
+        f"{counts.get(429, 0):>6} | {counts.get(503, 0):>6}"
+    )
+
+
+async def main(args):
+    capacity_rps = args.capacity * 1000 / args.service_ms
+    print(
+        f"{args.rate:g} req/s from 200 addresses plus {args.abusive_rate:g} req/s from one, against "
+        f"capacity for ~{capacity_rps:.0f} req/s, {args.duration:g}s per scenario; latency of the former"
+    )
+    print(f"{'scenario':>22} | {'ok req/s':>8} | {'p50 ms':>7} | {'p99 ms':>7} | {'max ms':>7} | {'429':>6} | {'503':>6}")
+    print("-" * 82)
+
+    # Generous per-address buckets: only the in-flight limit applies
+    unlimited_rate = (1e9, 1e9)
+    scenarios = [
+        ("no admission control", build_app(args.capacity, args.service_ms)),
+        ("in-flight limit", RateLimitMiddleware(
+            build_app(args.capacity, args.service_ms),
+            RateLimiter(MemoryBuckets(), args.max_in_flight, unlimited_rate, unlimited_rate, enabled=True)
+        )),
+        ("in-flight + per-IP", RateLimitMiddleware(
+            build_app(args.capacity, args.service_ms),
+            RateLimiter(MemoryBuckets(), args.max_in_flight, (args.ip_rate, args.ip_rate * 3), unlimited_rate, enabled=True)
+        )),
+    ]
+    for label, app in scenarios:
+        await run_scenario(label, app, args.rate, args.abusive_rate, args.duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show latency of served requests under overload with and without admission control")
+    parser.add_argument("--rate", type=float, default=300, help="Requests per second from well-behaved clients")
+    parser.add_argument("--abusive-rate", type=float, default=500, help="Requests per second from one address")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--capacity", type=int, default=8, help="Requests the stand-in backend serves at once")
+    parser.add_argument("--service-ms", type=float, default=20)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--ip-rate", type=float, default=5, help="Requests per second per address")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import TaskResponseSchema
+from pagination import page_response
+from queries import serialize_task
+
+# Run from the backend directory; no database needed:
+#   python -m benchmarks.serialization --tasks 10000
+
+
+def make_documents(count, user_count=50):
+    users = {str(ObjectId()): {"fullname": f"User {i}", "email": f"user{i}@example.com"} for i in range(user_count)}
+    user_ids = list(users)
+    documents = [
+        {
+            "_id": ObjectId(),
+            "title": f"Task {i}",
+            "description": "A task description of a realistic length for the dashboards. " * 3,
+            "assigned_to": user_ids[i % user_count],
+            "due_date": datetime(2026, 2, 15),
+            "status": "pending",
+            "priority": "medium",
+            "created_at": datetime.utcnow()
+        }
+        for i in range(count)
+    ]
+    return documents, users
+
+
+def before(documents, users):
+    # Per-row dicts with string conversions, then FastAPI's jsonable_encoder
+    # walk and json.dumps in JSONResponse
+    rows = []
+    for task in documents:
+        user = users.get(task["assigned_to"])
+        rows.append({
+            "id": str(task["_id"]),
+            "title": task["title"],
+            "description": task["description"],
+            "assigned_to": {
+                "id": task["assigned_to"],
+                "fullname": user["fullname"] if user else "Unknown",
+                "email": user["email"] if user else "Unknown"
+            },
+            "due_date": task["due_date"],
+            "status": task.get("status", "pending"),
+            "priority": task.get("priority", "medium"),
+            "created_at": task.get("created_at", "").isoformat() if task.get("created_at") else None
+        })
+    return json.dumps(jsonable_encoder(rows), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+task_list_adapter = TypeAdapter(List[TaskResponseSchema])
+
+
+def response_model(documents, users):
+    # Shared converter, then the response model validated and serialized to
+    # JSON bytes by Pydantic (FastAPI's path when a route returns plain data)
+    rows = [serialize_task(task, users) for task in documents]
+    return task_list_adapter.dump_json(task_list_adapter.validate_python(rows), exclude_unset=True)
+
+
+def after(documents, users):
+    # Shared converter rendered with orjson, as the list routes do
+    return page_response([serialize_task(task, users) for task in documents], None).body
+
+
+def measure(fn, documents, users, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(documents, users)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, len(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time task list serialization")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents, users = make_documents(args.tasks)
+    print(f"Serializing {args.tasks} tasks (best of {args.repeat})")
+    print(f"{'method':>28} | {'ms':>8} | {'ms/10k':>8} | {'bytes':>10}")
+    print("-" * 64)
+    for label, fn in [
+        ("dicts + jsonable_encoder", before),
+        ("response model dump_json", response_model),
+        ("converter + orjson", after),
+    ]:
+        elapsed, size = measure(fn, documents, users, args.repeat)
+        print(f"{label:>28} | {elapsed:>8.1f} | {elapsed * 10000 / args.tasks:>8.1f} | {size:>10}")
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from bson import ObjectId
+import settings  # noqa: F401  loads .env
+from pymongo import monitoring
+
+from database import create_client
+from queries import list_tasks
+
+# Run from the backend directory against the configured MONGO_DETAILS:
+#   python -m benchmarks.task_listing --counts 1000 5000 20000
+BENCH_DATABASE = "task_manager_bench"
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def seed(users, tasks, task_count, user_count):
+    await users.delete_many({})
+    await tasks.delete_many({})
+
+    user_ids = [ObjectId() for _ in range(user_count)]
+    await users.insert_many([
+        {
+            "_id": user_id,
+            "fullname": f"Bench User {i}",
+            "email": f"bench{i}@example.com",
+            "password": "x",
+            "role": "user",
+            "created_at": datetime.utcnow()
+        }
+        for i, user_id in enumerate(user_ids)
+    ])
+    await tasks.insert_many([
+        {
+            "title": f"Task {i}",
+            "description": "Benchmark task",
+            "assigned_to": str(user_ids[i % user_count]),
+            "due_date": datetime(2026, 2, 15),
+            "status": "pending",
+            "priority": "medium",
+            "created_at": datetime.utcnow()
+        }
+        for i in range(task_count)
+    ])
+
+
+async def list_tasks_per_row(tasks, users):
+    # The original implementation: one find_one per task
+    result = []
+    async for task in tasks.find():
+        user = await users.find_one({"_id": ObjectId(task["assigned_to"])})
+        result.append((task, user))
+    return result
+
+
+async def measure(counter, coro):
+    counter.count = 0
+    start = time.perf_counter()
+    await coro
+    return counter.count, (time.perf_counter() - start) * 1000
+
+
+async def run(counts, user_count):
+    counter = RoundTripCounter()
+    client = create_client(event_listeners=[counter])
+    database = client[BENCH_DATABASE]
+    users = database.get_collection("users")
+    tasks = database.get_collection("tasks")
+
+    print(f"{'tasks':>8} | {'per-row trips':>13} | {'per-row ms':>10} | {'batched trips':>13} | {'batched ms':>10}")
+    print("-" * 68)
+    try:
+        for task_count in counts:
+            await seed(users, tasks, task_count, user_count)
+            naive_trips, naive_ms = await measure(counter, list_tasks_per_row(tasks, users))
+            batched_trips, batched_ms = await measure(counter, list_tasks(tasks=tasks, users=users))
+            print(f"{task_count:>8} | {naive_trips:>13} | {naive_ms:>10.1f} | {batched_trips:>13} | {batched_ms:>10.1f}")
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-task and batched assignee lookups")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.counts, args.users))
@@ -0,0 +1,323 @@
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import task_collection, user_collection
+from models import TaskSchema, TaskStatusUpdateSchema, TASK_STATUSES
+from queries import serialize_task, fetch_assignees, assignee_snapshot, TASK_FIELDS
+from stats import record_tasks_created, record_status_changes
+from events import hub
+from scheduler import schedule_fields, reschedule_fields
+from history import history, created_event, status_event
+from http_cache import versions, user_tasks_key, TASKS
+
+# Items validated and written per round trip
+BULK_CHUNK_SIZE = 1000
+# Conditional status writes tried before an item is reported as conflicting
+STATUS_UPDATE_ATTEMPTS = 3
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# What a status update needs from the current task: ownership, the counters
+# and history, and the scheduler queue
+STATUS_UPDATE_PROJECTION = {
+    "assigned_to": 1, "status": 1, "created_at": 1, "status_changed_at": 1,
+    "due_date": 1, "reminder_sent_at": 1, "overdue_at": 1
+}
+
+
+class RequestStreamingResponse(StreamingResponse):
+    # For bodies that read the request stream while responding. The default
+    # implementation also listens for disconnects on the same receive
+    # channel, which would steal request chunks; reading the request already
+    # raises ClientDisconnect when the client goes away.
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def is_ndjson(request: Request):
+    return request.headers.get("content-type", "").split(";")[0].strip() == NDJSON_MEDIA_TYPE
+
+
+async def iter_request_items(request: Request):
+    # Yields raw items from a JSON array body, or line by line from an
+    # NDJSON body so arbitrarily large uploads are never fully buffered.
+    # Lines that are not valid JSON are yielded as ValueError instances.
+    if not is_ndjson(request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, list):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Request body must be a JSON array or NDJSON"
+            )
+        for item in body:
+            yield item
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+async def iter_chunks(items, size=BULK_CHUNK_SIZE):
+    # Groups an async iterator into lists of (index, item)
+    chunk = []
+    index = 0
+    async for item in items:
+        chunk.append((index, item))
+        index += 1
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validation_error(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+def _validate(schema, index, raw):
+    if isinstance(raw, ValueError):
+        return None, {"index": index, "ok": False, "error": str(raw)}
+    try:
+        return schema.model_validate(raw), None
+    except ValidationError as e:
+        return None, {"index": index, "ok": False, "error": _validation_error(e)}
+
+
+async def create_tasks_chunk(chunk, admin):
+    results = {}
+    valid = []
+    for index, raw in chunk:
+        task, error = _validate(TaskSchema, index, raw)
+        if error:
+            results[index] = error
+        else:
+            valid.append((index, task))
+
+    # Every assignee in the chunk is checked with a single $in query
+    assignee_ids = {ObjectId(task.assigned_to) for _, task in valid if ObjectId.is_valid(task.assigned_to)}
+    assignees = {}
+    if assignee_ids:
+        async for user in user_collection.find({"_id": {"$in": list(assignee_ids)}}, {"fullname": 1, "email": 1}):
+            assignees[str(user["_id"])] = user
+
+    documents = []
+    created_at = datetime.utcnow()
+    for index, task in valid:
+        if task.assigned_to not in assignees:
+            results[index] = {"index": index, "ok": False, "error": "Assigned user not found"}
+            continue
+        task_dict = jsonable_encoder(task)
+        task_dict["_id"] = ObjectId()
+        task_dict["due_date"] = task.due_date
+        task_dict.update(schedule_fields(task.due_date))
+        task_dict["assigned_to"] = assignees[task.assigned_to]["_id"]
+        task_dict["assignee"] = assignee_snapshot(assignees[task.assigned_to])
+        task_dict["created_at"] = created_at
+        task_dict["created_by"] = str(admin["_id"])
+        documents.append((index, task_dict))
+
+    failed = set()
+    if documents:
+        try:
+            await task_collection.insert_many([doc for _, doc in documents], ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                index, _ = documents[write_error["index"]]
+                failed.add(index)
+                results[index] = {"index": index, "ok": False, "error": write_error.get("errmsg", "Write failed")}
+
+    inserted = [(index, doc) for index, doc in documents if index not in failed]
+    await record_tasks_created([doc for _, doc in inserted])
+    history.record(*(created_event(doc, str(admin["_id"])) for _, doc in inserted))
+    if inserted:
+        await versions.bump(TASKS, *(user_tasks_key(doc["assigned_to"]) for _, doc in inserted))
+    for index, doc in inserted:
+        results[index] = {"index": index, "ok": True, "task_id": str(doc["_id"])}
+        hub.publish("task.created", serialize_task(doc, {}), str(doc["assigned_to"]))
+
+    return [results[index] for index, _ in chunk]
+
+
+class StatusConflict(Exception):
+    pass
+
+
+def status_update(task, new_status, updated_at):
+    # task is the document as read, with at least its status, due date and
+    # scheduler fields
+    schedule_set, schedule_unset = reschedule_fields(task, new_status)
+    update = {"$set": {"status": new_status, "updated_at": updated_at, "status_changed_at": updated_at, **schedule_set}}
+    if schedule_unset:
+        update["$unset"] = schedule_unset
+    return update
+
+
+async def set_status(task, new_status, updated_at):
+    # Writes the new status only if the task still has the status it was
+    # read with, so the counters and history follow from the status actually
+    # replaced. Re-reads and retries when another request changed it in
+    # between. Returns the pre-image, or None if the task is gone.
+    for _ in range(STATUS_UPDATE_ATTEMPTS):
+        previous = await task_collection.find_one_and_update(
+            {"_id": task["_id"], "status": task.get("status")},
+            status_update(task, new_status, updated_at),
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is not None:
+            return previous
+        task = await task_collection.find_one({"_id": task["_id"]})
+        if task is None:
+            return None
+    raise StatusConflict()
+
+
+async def update_statuses_chunk(chunk, current_user):
+    results = {}
+    valid = []
+    for index, raw in chunk:
+        update, error = _validate(TaskStatusUpdateSchema, index, raw)
+        if error:
+            results[index] = error
+        elif update.status not in TASK_STATUSES:
+            results[index] = {"index": index, "ok": False, "error": f"Invalid status. Must be one of: {TASK_STATUSES}"}
+        elif not ObjectId.is_valid(update.task_id):
+            results[index] = {"index": index, "ok": False, "error": "Task not found"}
+        else:
+            valid.append((index, update))
+
+    # Read every task in the chunk at once to check ownership and old status
+    task_ids = list({ObjectId(update.task_id) for _, update in valid})
+    tasks = {}
+    if task_ids:
+        async for task in task_collection.find(
+            {"_id": {"$in": task_ids}}, STATUS_UPDATE_PROJECTION
+        ):
+            tasks[str(task["_id"])] = task
+
+    user_id = str(current_user["_id"])
+    is_admin = current_user.get("role") == "admin"
+    # task_id -> (task, old status, new status). Only one conditional write
+    # per task can apply, so repeats of a task within a chunk are rejected.
+    changes = {}
+    accepted = []
+    for index, update in valid:
+        if update.task_id in changes:
+            results[index] = {"index": index, "ok": False, "error": "Task is listed more than once; only its first update was applied"}
+            continue
+        task = tasks.get(update.task_id)
+        if task is None:
+            results[index] = {"index": index, "ok": False, "error": "Task not found"}
+            continue
+        if str(task["assigned_to"]) != user_id and not is_admin:
+            results[index] = {"index": index, "ok": False, "error": "You can only update your own tasks"}
+            continue
+        changes[update.task_id] = (task, task.get("status", "pending"), update.status)
+        accepted.append((index, update.task_id))
+
+    failed = {}
+    if changes:
+        # Truncated to what BSON stores, so the stamp can be matched when
+        # the writes are read back
+        updated_at = datetime.utcnow()
+        updated_at = updated_at.replace(microsecond=updated_at.microsecond // 1000 * 1000)
+        result = await task_collection.bulk_write(
+            [
+                UpdateOne({"_id": task["_id"], "status": task.get("status")}, status_update(task, new_status, updated_at))
+                for task, _, new_status in changes.values()
+            ],
+            ordered=False
+        )
+        if result.matched_count < len(changes):
+            failed = await _retry_status_changes(changes, updated_at)
+        await record_status_changes(list(changes.values()))
+        history.record(*(
+            status_event(task, old_status, new_status, updated_at, user_id)
+            for task, old_status, new_status in changes.values()
+            if old_status != new_status
+        ))
+        if changes:
+            await versions.bump(TASKS, *(user_tasks_key(task["assigned_to"]) for task, _, _ in changes.values()))
+            await _publish_status_changes(changes.values(), updated_at)
+
+    for index, task_id in accepted:
+        if task_id in failed:
+            results[index] = {"index": index, "ok": False, "error": failed[task_id]}
+        else:
+            results[index] = {"index": index, "ok": True}
+    return [results[index] for index, _ in chunk]
+
+
+async def _retry_status_changes(changes, updated_at):
+    # Some tasks changed status between the read and the conditional write.
+    # The ones written carry this chunk's stamp; the rest are written one at
+    # a time from a fresh read. Updates changes in place and returns
+    # {task_id: error} for the tasks that could not be updated.
+    written = set()
+    async for task in task_collection.find(
+        {"_id": {"$in": [task["_id"] for task, _, _ in changes.values()]}, "status_changed_at": updated_at}, {"_id": 1}
+    ):
+        written.add(task["_id"])
+    failed = {}
+    for task_id, (task, _, new_status) in list(changes.items()):
+        if task["_id"] in written:
+            continue
+        try:
+            previous = await set_status(task, new_status, updated_at)
+        except StatusConflict:
+            previous = None
+            failed[task_id] = "Task is being updated by another request; retry"
+        if previous is None:
+            failed.setdefault(task_id, "Task not found")
+            del changes[task_id]
+        else:
+            changes[task_id] = (previous, previous.get("status", "pending"), new_status)
+    return failed
+
+
+async def _publish_status_changes(changes, updated_at):
+    changed = [
+        {**task, "status": new_status, "updated_at": updated_at}
+        for task, _, new_status in changes
+        if hub.has_audience(str(task["assigned_to"]))
+    ]
+    if not changed:
+        return
+    # The bulk read above projected only what the write needed
+    full_tasks = {}
+    async for task in task_collection.find({"_id": {"$in": [task["_id"] for task in changed]}}):
+        full_tasks[task["_id"]] = task
+    assignees = await fetch_assignees([task for task in full_tasks.values() if "assignee" not in task])
+    for task in changed:
+        if task["_id"] in full_tasks:
+            full = {**full_tasks[task["_id"]], "status": task["status"], "updated_at": updated_at}
+            hub.publish("task.status_changed", serialize_task(full, assignees, TASK_FIELDS), str(task["assigned_to"]))
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+
+import settings  # noqa: F401  loads .env
+from pymongo.errors import OperationFailure
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_BUS_ENABLED = os.getenv("INVALIDATION_BUS_ENABLED", "true").lower() == "true"
+# The capped collection keeps about this much recent traffic; a worker whose
+# change stream falls further behind than that resyncs from scratch
+INVALIDATION_BUS_SIZE_BYTES = int(os.getenv("INVALIDATION_BUS_SIZE_BYTES", 16 * 1024 * 1024))
+INVALIDATION_BUS_RETRY_SECONDS = float(os.getenv("INVALIDATION_BUS_RETRY_SECONDS", 1))
+# While the database is unreachable the oldest unsent messages are dropped
+# beyond this many; the periodic syncs cover what they carried
+INVALIDATION_BUS_MAX_BUFFERED = int(os.getenv("INVALIDATION_BUS_MAX_BUFFERED", 10000))
+
+bus_collection = database.get_collection("invalidation_bus")
+
+# Server error codes
+CHANGE_STREAM_HISTORY_LOST = 286
+CHANGE_STREAM_FATAL = 280
+
+
+class InvalidationBus:
+    # Pub/sub between workers. A message is a document inserted into a
+    # capped collection; every worker follows the collection with a change
+    # stream and hands messages from other workers to the handlers for their
+    # channel, typically within milliseconds. Change streams need a replica
+    # set (a single node is enough). On a standalone server the bus stays
+    # off and workers rely on their periodic syncs alone.
+    #
+    # Publishing is synchronous and buffered, so the components that publish
+    # (caches, revocations, the event hub) stay free of database calls; a
+    # background task writes the buffer as soon as something is in it.
+
+    def __init__(self, collection=bus_collection, enabled=INVALIDATION_BUS_ENABLED):
+        self.collection = collection
+        self.enabled = enabled
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.active = False
+        self._handlers = {}  # channel -> [handler(data)]
+        self._resync_handlers = []
+        self._outbox = []
+        self._pending = None
+        self._stream = None
+        self._resume_token = None
+        self._start_at = None
+        self.published = 0
+        self.dropped = 0
+        self.received = 0
+        self.handler_errors = 0
+        self.stream_errors = 0
+        self.resyncs = 0
+        self.last_lag_seconds = 0.0
+
+    def subscribe(self, channel, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_resync(self, handler):
+        # Awaited when messages may have been missed, e.g. after the stream
+        # fell behind the capped collection; should reload state in full
+        self._resync_handlers.append(handler)
+
+    def publish(self, channel, data):
+        if not self.active:
+            return
+        self._outbox.append({"channel": channel, "origin": self.origin, "data": data, "at": datetime.utcnow()})
+        overflow = len(self._outbox) - INVALIDATION_BUS_MAX_BUFFERED
+        if overflow > 0:
+            del self._outbox[:overflow]
+            self.dropped += overflow
+        if self._pending is not None:
+            self._pending.set()
+
+    async def flush(self):
+        while self._outbox:
+            batch = self._outbox
+            self._outbox = []
+            try:
+                await self.collection.insert_many(batch, ordered=True)
+            except Exception:
+                self._outbox[:0] = batch
+                raise
+            self.published += len(batch)
+
+    def _watch(self, resume_after=None, start_at=None):
+        # Other workers' inserts only; this worker already applied its own
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.origin": {"$ne": self.origin}}}]
+        return self.collection.watch(pipeline, resume_after=resume_after, start_at_operation_time=start_at)
+
+    async def open(self):
+        # Marks the point the first change stream starts from. Called at
+        # startup before the initial syncs, so nothing published in between
+        # is missed. Only replica sets and sharded clusters report an
+        # operation time; a standalone server cannot run change streams.
+        if not self.enabled:
+            return False
+        reply = await self.collection.database.command("ping")
+        if "operationTime" not in reply:
+            logger.warning("Invalidation bus disabled: change streams need a replica set")
+            return False
+        self._start_at = reply["operationTime"]
+        self.active = True
+        return True
+
+    def _dispatch(self, message):
+        self.received += 1
+        self.last_lag_seconds = max(0.0, (datetime.utcnow() - message["at"]).total_seconds())
+        for handler in self._handlers.get(message["channel"], ()):
+            try:
+                handler(message["data"])
+            except Exception as e:
+                self.handler_errors += 1
+                logger.error(f"Invalidation bus handler for {message['channel']} failed: {e}")
+
+    async def _close_stream(self):
+        # Keeps the resume token so the next stream continues where this one
+        # stopped
+        if self._stream is not None:
+            self._resume_token = self._stream.resume_token or self._resume_token
+            await self._stream.close()
+            self._stream = None
+
+    async def _reopen(self):
+        if self._resume_token is not None:
+            stream = self._watch(resume_after=self._resume_token)
+        else:
+            stream = self._watch(start_at=self._start_at)
+        missed = self._resume_token is None and self._start_at is None
+        try:
+            change = await stream.try_next()
+        except OperationFailure as e:
+            await stream.close()
+            if e.code not in (CHANGE_STREAM_HISTORY_LOST, CHANGE_STREAM_FATAL):
+                raise
+            # The resume point is gone: start from now
+            stream = self._watch()
+            change = await stream.try_next()
+            missed = True
+        self._stream = stream
+        self._start_at = None
+        if missed:
+            await self._resync()
+        if change is not None:
+            self._dispatch(change["fullDocument"])
+
+    async def _resync(self):
+        self.resyncs += 1
+        for handler in self._resync_handlers:
+            await handler()
+
+    async def _listen(self):
+        while True:
+            try:
+                if self._stream is None:
+                    await self._reopen()
+                async for change in self._stream:
+                    self._dispatch(change["fullDocument"])
+            except Exception as e:
+                # The driver has already retried resumable errors once
+                self.stream_errors += 1
+                logger.error(f"Invalidation bus stream failed: {e}")
+                await self._close_stream()
+                await asyncio.sleep(INVALIDATION_BUS_RETRY_SECONDS)
+
+    async def _write(self):
+        while True:
+            await self._pending.wait()
+            self._pending.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Invalidation bus publish failed: {e}")
+                await asyncio.sleep(INVALIDATION_BUS_RETRY_SECONDS)
+                self._pending.set()
+
+    async def run(self):
+        if not self.active:
+            return
+        self._pending = asyncio.Event()
+        if self._outbox:
+            self._pending.set()
+        try:
+            await asyncio.gather(self._listen(), self._write())
+        finally:
+            self.active = False
+            await self._close_stream()
+
+    def stats(self):
+        return {
+            "active": int(self.active),
+            "published": self.published,
+            "dropped": self.dropped,
+            "received": self.received,
+            "buffered": len(self._outbox),
+            "handler_errors": self.handler_errors,
+            "stream_errors": self.stream_errors,
+            "resyncs": self.resyncs,
+            "last_lag_seconds": self.last_lag_seconds
+        }
+
+
+bus = InvalidationBus()
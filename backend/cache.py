@@ -0,0 +1,75 @@
+import os
+import time
+from collections import OrderedDict
+
+import settings  # noqa: F401  loads .env
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+
+class TTLCache:
+    # Bounded LRU cache whose entries also expire after ttl seconds.
+    # Single-threaded use from the event loop only.
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Called with the key on every local invalidation so a shared
+        # backend can forward it to the other workers.
+        self._publishers = []
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (value, self.clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key, publish=True):
+        self._entries.pop(key, None)
+        if publish:
+            for publisher in self._publishers:
+                publisher(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def add_publisher(self, publisher):
+        self._publishers.append(publisher)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+# Authenticated user documents keyed by token subject (email)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
@@ -1,21 +1,19 @@
 import asyncio
-import motor.motor_asyncio
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
-
-MONGO_DETAILS = os.getenv("MONGO_DETAILS", "mongodb://localhost:27017")
+from database import create_client, MONGO_DATABASE
 
 async def check_db():
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
-    database = client.task_manager
+    client = create_client()
+    database = client[MONGO_DATABASE]
     user_collection = database.get_collection("users")
     
-    users = await user_collection.find().to_list(100)
-    print(f"Total users: {len(users)}")
-    for u in users:
-        print(f"Email: {u.get('email')}, Role: {u.get('role')}")
+    try:
+        users = await user_collection.find().to_list(100)
+        print(f"Total users: {len(users)}")
+        for u in users:
+            print(f"Email: {u.get('email')}, Role: {u.get('role')}")
+    finally:
+        client.close()
 
 if __name__ == "__main__":
     asyncio.run(check_db())
@@ -1,14 +1,115 @@
+import asyncio
 import motor.motor_asyncio
 import os
-from dotenv import load_dotenv
+import settings  # noqa: F401  loads .env
+from pymongo import ReadPreference, read_preferences
 
-load_dotenv()
+from metrics import command_listener, pool_monitor
 
 MONGO_DETAILS = os.getenv("MONGO_DETAILS", "mongodb://localhost:27017")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "task_manager")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
+# Client options. Unset values fall back to the connection string and then
+# to the driver defaults; set values override both.
+MONGO_POOL_OPTIONS = {
+    # Per process: with N uvicorn workers the server sees N * maxPoolSize
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+    # How long a request waits for a free pooled connection before failing
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+    "socketTimeoutMS": "MONGO_SOCKET_TIMEOUT_MS",
+}
+# Fail fast instead of holding requests for the driver's 30s default when no
+# server is reachable
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+# e.g. "zstd,snappy,zlib"; zstd needs backports.zstd (Python < 3.14) and
+# snappy needs python-snappy, otherwise the driver skips them with a warning
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
+MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "taskmanager-api")
+# Connections opened at startup, before the worker reports ready, so the
+# first requests do not pay for the TCP, TLS and auth handshakes
+MONGO_WARM_CONNECTIONS = int(os.getenv("MONGO_WARM_CONNECTIONS", 4))
 
-database = client.task_manager
+# Read preference for the heavy admin listings, exports and stats
+# aggregations, which tolerate slightly stale data. On a standalone server
+# every mode reads from the primary.
+MONGO_ANALYTICS_READ_PREFERENCE = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+# -1 for no limit; otherwise at least 90 seconds
+MONGO_ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", -1))
+
+READ_PREFERENCES = {
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def client_options():
+    options = {
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "appname": MONGO_APP_NAME,
+    }
+    for option, env_name in MONGO_POOL_OPTIONS.items():
+        value = os.getenv(env_name)
+        if value:
+            options[option] = int(value)
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+
+def create_client(url=MONGO_DETAILS, event_listeners=(), **overrides):
+    # Every client in the app and its scripts is built here so they share
+    # the pool settings and the metrics listeners; scripts may add their own
+    return motor.motor_asyncio.AsyncIOMotorClient(
+        url,
+        event_listeners=[command_listener, pool_monitor, *event_listeners],
+        **{**client_options(), **overrides}
+    )
+
+
+def read_preference(mode, max_staleness=-1):
+    if mode == "primary":
+        return ReadPreference.PRIMARY
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}")
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+# Creating the client does no I/O and starts no threads; it connects on the
+# first command, normally connect() in the app lifespan. Forked workers each
+# get their own copy before that happens.
+client = create_client()
+
+database = client[MONGO_DATABASE]
 
 user_collection = database.get_collection("users")
 task_collection = database.get_collection("tasks")
+
+if MONGO_ANALYTICS_READ_PREFERENCE == "primary":
+    analytics_user_collection = user_collection
+    analytics_task_collection = task_collection
+else:
+    analytics_read_preference = read_preference(MONGO_ANALYTICS_READ_PREFERENCE, MONGO_ANALYTICS_MAX_STALENESS_SECONDS)
+    analytics_user_collection = user_collection.with_options(read_preference=analytics_read_preference)
+    analytics_task_collection = task_collection.with_options(read_preference=analytics_read_preference)
+
+
+async def ping():
+    await client.admin.command("ping")
+
+
+async def connect(warm_connections=MONGO_WARM_CONNECTIONS):
+    # Raises when no server is reachable within the server selection
+    # timeout. Concurrent pings each check out their own connection, which
+    # fills the pool up to warm_connections.
+    await ping()
+    if warm_connections > 1:
+        await asyncio.gather(*(ping() for _ in range(warm_connections)))
+
+
+def close():
+    client.close()
@@ -0,0 +1,17 @@
+import asyncio
+import logging
+
+from emails import dispatcher
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Delivers queued emails from the email_outbox collection. Run one or more
+# of these alongside the API with EMAIL_DISPATCHER_IN_APP=false; claims are
+# atomic, so several dispatchers never send the same message twice.
+if __name__ == "__main__":
+    logger.info("Email dispatcher started")
+    try:
+        asyncio.run(dispatcher.run())
+    except KeyboardInterrupt:
+        logger.info(f"Email dispatcher stopped: {dispatcher.stats()}")
@@ -1,33 +1,72 @@
+import asyncio
+import base64
+import hashlib
+import html
+import logging
 import os
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import aiosmtplib
+import orjson
+from cryptography.fernet import Fernet, InvalidToken
 from pydantic import EmailStr
-from dotenv import load_dotenv
+import settings  # noqa: F401  loads .env
+
+from auth import SECRET_KEY
+from database import database
+from ratelimit import MongoBuckets
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Check for required email settings
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM", MAIL_USERNAME)
+MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME", "TaskManager")
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+# For a local stub such as `python -m aiosmtpd -n -l localhost:1025`, set
+# MAIL_SERVER=localhost, MAIL_PORT=1025, MAIL_STARTTLS=false, USE_CREDENTIALS=false
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() == "true"
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() == "true"
+USE_CREDENTIALS = os.getenv("USE_CREDENTIALS", "true").lower() == "true"
+VALIDATE_CERTS = os.getenv("VALIDATE_CERTS", "true").lower() == "true"
 
-conf = None
-if MAIL_USERNAME and MAIL_PASSWORD and MAIL_PASSWORD != "your_app_password":
-    conf = ConnectionConfig(
-        MAIL_USERNAME=MAIL_USERNAME,
-        MAIL_PASSWORD=MAIL_PASSWORD,
-        MAIL_FROM=os.getenv("MAIL_FROM", MAIL_USERNAME),
-        MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
-        MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-        MAIL_FROM_NAME=os.getenv("MAIL_FROM_NAME", "TaskManager"),
-        MAIL_STARTTLS=True,
-        MAIL_SSL_TLS=False,
-        USE_CREDENTIALS=True,
-        VALIDATE_CERTS=True
-    )
-else:
-    print("⚠️ Email settings not configured in .env. Email features will be disabled.")
+# Dispatcher tuning
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+EMAIL_RATE_PER_SECOND = float(os.getenv("EMAIL_RATE_PER_SECOND", 5))
+# mongo: EMAIL_RATE_PER_SECOND holds across every dispatcher, in-app or
+# email_worker.py, at one extra round trip per send. memory: it holds per
+# dispatcher process, so N workers send up to N times as fast.
+EMAIL_RATE_LIMIT_BACKEND = os.getenv("EMAIL_RATE_LIMIT_BACKEND", "mongo")
+EMAIL_SMTP_CONNECTIONS = int(os.getenv("EMAIL_SMTP_CONNECTIONS", 2))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 6))
+EMAIL_BACKOFF_SECONDS = float(os.getenv("EMAIL_BACKOFF_SECONDS", 30))
+EMAIL_MAX_BACKOFF_SECONDS = float(os.getenv("EMAIL_MAX_BACKOFF_SECONDS", 3600))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", 2))
+# A claimed message whose dispatcher died is retried after this long
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", 120))
 
-async def send_credentials_email(email: EmailStr, fullname: str, password: str):
-    html = f"""
+mail_configured = bool(
+    MAIL_SERVER and (not USE_CREDENTIALS or (MAIL_USERNAME and MAIL_PASSWORD and MAIL_PASSWORD != "your_app_password"))
+)
+if not mail_configured:
+    logger.warning("Email settings not configured in .env; emails are logged instead of sent")
+
+outbox_collection = database.get_collection("email_outbox")
+
+# Template parameters that must not be readable in the outbox, such as a
+# temporary password, are stored encrypted with a key derived from
+# SECRET_KEY and dropped once the message is sent or given up on
+_secret_box = Fernet(base64.urlsafe_b64encode(hashlib.sha256(b"email-outbox:" + SECRET_KEY.encode()).digest()))
+
+
+def render_credentials_email(email: EmailStr, fullname: str, password: str) -> str:
+    return f"""
     <html>
     <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
         <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; rounded: 8px;">
@@ -46,20 +85,329 @@ async def send_credentials_email(email: EmailStr, fullname: str, password: str):
     </html>
     """
 
-    message = MessageSchema(
-        subject="Your TaskManager Account Credentials",
-        recipients=[email],
-        body=html,
-        subtype=MessageType.html
+
+def render_due_date_email(fullname: str, due_soon: list, overdue: list) -> str:
+    # due_soon and overdue: [(title, due date string)]
+    def task_rows(tasks, color):
+        return "".join(
+            f'<p style="margin: 5px 0;"><strong style="color: {color};">{html.escape(title)}</strong> &middot; due {due}</p>'
+            for title, due in tasks
+        )
+
+    sections = ""
+    if overdue:
+        sections += f"""
+            <p>These tasks are past their due date:</p>
+            <div style="background-color: #f6f7f8; padding: 15px; border-radius: 5px; margin: 20px 0;">{task_rows(overdue, "#ff4444")}</div>"""
+    if due_soon:
+        sections += f"""
+            <p>These tasks are due soon:</p>
+            <div style="background-color: #f6f7f8; padding: 15px; border-radius: 5px; margin: 20px 0;">{task_rows(due_soon, "#137fec")}</div>"""
+    return f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; rounded: 8px;">
+            <h2 style="color: #137fec;">Task reminder</h2>
+            <p>Hello <strong>{html.escape(fullname)}</strong>,</p>{sections}
+            <p>Best regards,<br>The TaskManager Team</p>
+        </div>
+    </body>
+    </html>
+    """
+
+
+# Rendered when the message is sent, so the outbox only holds parameters
+TEMPLATES = {
+    "credentials": render_credentials_email,
+    "due_date": render_due_date_email,
+}
+
+
+def _outbox_message(recipient: str, subject: str, template: str, params: dict, secrets: dict, now: datetime) -> dict:
+    message = {
+        "to": recipient,
+        "subject": subject,
+        "template": template,
+        "params": params,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now
+    }
+    if secrets:
+        message["secrets"] = _secret_box.encrypt(orjson.dumps(secrets)).decode()
+    return message
+
+
+def render_message(message) -> str:
+    if "html" in message:
+        # Queued before messages were rendered at send time
+        return message["html"]
+    params = dict(message.get("params") or {})
+    if "secrets" in message:
+        try:
+            params.update(orjson.loads(_secret_box.decrypt(message["secrets"].encode())))
+        except InvalidToken:
+            raise ValueError("Cannot decrypt the message parameters; was SECRET_KEY changed?")
+    return TEMPLATES[message["template"]](**params)
+
+
+async def queue_email(recipient: str, subject: str, template: str, params: dict, secrets: dict = None):
+    # Persist first; the dispatcher delivers it even if this worker restarts
+    await outbox_collection.insert_one(_outbox_message(recipient, subject, template, params, secrets, datetime.utcnow()))
+
+
+async def queue_emails(messages):
+    # messages: [(recipient, subject, template, params)], queued with one insert
+    if not messages:
+        return
+    now = datetime.utcnow()
+    await outbox_collection.insert_many(
+        [_outbox_message(recipient, subject, template, params, None, now) for recipient, subject, template, params in messages],
+        ordered=False
+    )
+
+
+async def send_credentials_email(email: EmailStr, fullname: str, password: str):
+    await queue_email(
+        email,
+        "Your TaskManager Account Credentials",
+        "credentials",
+        {"email": email, "fullname": fullname},
+        secrets={"password": password}
     )
 
-    if conf:
+
+async def send_due_date_reminders(notices):
+    # notices: {email: {"fullname": ..., "due_soon": [...], "overdue": [...]}},
+    # one digest per assignee
+    messages = []
+    for email, notice in notices.items():
+        if notice["overdue"]:
+            subject = f"{len(notice['overdue'])} TaskManager task(s) overdue"
+        else:
+            subject = f"{len(notice['due_soon'])} TaskManager task(s) due soon"
+        params = {"fullname": notice["fullname"], "due_soon": notice["due_soon"], "overdue": notice["overdue"]}
+        messages.append((email, subject, "due_date", params))
+    await queue_emails(messages)
+
+
+def build_message(message):
+    mail = EmailMessage()
+    mail["From"] = f"{MAIL_FROM_NAME} <{MAIL_FROM}>" if MAIL_FROM else MAIL_FROM_NAME
+    mail["To"] = message["to"]
+    mail["Subject"] = message["subject"]
+    mail.set_content("This message requires an HTML capable email client.")
+    mail.add_alternative(render_message(message), subtype="html")
+    return mail
+
+
+class SMTPPool:
+    # A fixed set of long-lived SMTP sessions shared by the dispatcher, so
+    # each batch reuses existing TLS connections instead of opening new ones.
+
+    def __init__(self, size=EMAIL_SMTP_CONNECTIONS):
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+        self._sessions = []
+
+    async def _connect(self):
+        smtp = aiosmtplib.SMTP(
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS if not MAIL_SSL_TLS else False,
+            validate_certs=VALIDATE_CERTS
+        )
+        await smtp.connect()
+        if USE_CREDENTIALS:
+            try:
+                await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+            except Exception:
+                # Not pooled yet, so nothing else would close it
+                await self._discard(smtp)
+                raise
+        self._sessions.append(smtp)
+        return smtp
+
+    async def send(self, mail):
+        smtp = await self._idle.get()
+        try:
+            if smtp is None or not smtp.is_connected:
+                smtp = await self._connect()
+            await smtp.send_message(mail)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, OSError):
+            # Drop the broken session; the next send reconnects
+            await self._discard(smtp)
+            smtp = None
+            raise
+        finally:
+            self._idle.put_nowait(smtp)
+
+    async def _discard(self, smtp):
+        if smtp is None:
+            return
+        if smtp in self._sessions:
+            self._sessions.remove(smtp)
         try:
-            fm = FastMail(conf)
-            await fm.send_message(message)
-            print(f"✅ Email sent successfully to {email}")
+            smtp.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        for smtp in list(self._sessions):
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+        self._sessions.clear()
+
+
+class RateLimiter:
+    # Spaces sends evenly at no more than `rate` per second across sessions
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+class SharedRateLimiter(RateLimiter):
+    # The same spacing within this process, then a token bucket in Mongo
+    # shared by every dispatcher, holding at most one send's worth of tokens
+
+    def __init__(self, rate, key="email:send", buckets=None):
+        super().__init__(rate)
+        self.rate = rate
+        self.key = key
+        self.buckets = buckets or MongoBuckets()
+
+    async def wait(self):
+        await super().wait()
+        if self.rate <= 0:
+            return
+        while True:
+            wait = await self.buckets.take(self.key, 1, self.rate, 1)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class EmailDispatcher:
+    def __init__(self, outbox=outbox_collection, pool=None):
+        self.outbox = outbox
+        self.pool = pool
+        if EMAIL_RATE_LIMIT_BACKEND == "mongo":
+            self.rate_limiter = SharedRateLimiter(EMAIL_RATE_PER_SECOND)
+        else:
+            self.rate_limiter = RateLimiter(EMAIL_RATE_PER_SECOND)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=1000)
+
+    async def claim_batch(self, limit=EMAIL_BATCH_SIZE):
+        # Three round trips per batch: pick ids, claim them, read them back
+        now = datetime.utcnow()
+        claim = uuid.uuid4().hex
+        due = {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "locked_until": {"$lte": now}}
+        ]}
+        ids = [doc["_id"] async for doc in self.outbox.find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(limit)]
+        if not ids:
+            return []
+        await self.outbox.update_many(
+            {"$and": [{"_id": {"$in": ids}}, due]},
+            {"$set": {"status": "sending", "claim": claim, "locked_until": now + timedelta(seconds=EMAIL_LEASE_SECONDS)}}
+        )
+        return await self.outbox.find({"claim": claim, "status": "sending"}).to_list(limit)
+
+    async def deliver(self, message):
+        if not mail_configured:
+            logger.info(f"Simulated email to {message['to']}: {message['subject']}")
+            return
+        await self.pool.send(build_message(message))
+
+    async def process(self, message):
+        await self.rate_limiter.wait()
+        start = time.perf_counter()
+        try:
+            await self.deliver(message)
         except Exception as e:
-            print(f"⚠️ Failed to send email to {email}: {e}")
-            print(f"📧 User {fullname} was created with password: {password}")
-    else:
-        print(f"📧 Simulated Email to {email}: User {fullname} created with password {password}")
+            await self._record_failure(message, e)
+            return
+        self._latencies.append(time.perf_counter() - start)
+        self.sent += 1
+        # Secrets are not kept once sent
+        await self.outbox.update_one(
+            {"_id": message["_id"], "claim": message["claim"]},
+            {"$set": {"status": "sent", "sent_at": datetime.utcnow()}, "$unset": {"secrets": "", "html": "", "claim": "", "locked_until": ""}}
+        )
+
+    async def _record_failure(self, message, error):
+        attempts = message.get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_error": str(error)}
+        if attempts >= EMAIL_MAX_ATTEMPTS:
+            self.failed += 1
+            logger.error(f"Giving up on email to {message['to']} after {attempts} attempts: {error}")
+            await self.outbox.update_one(
+                {"_id": message["_id"], "claim": message["claim"]},
+                {"$set": {**update, "status": "failed", "failed_at": datetime.utcnow()}, "$unset": {"secrets": "", "html": "", "claim": ""}}
+            )
+            return
+
+        self.retried += 1
+        delay = min(EMAIL_MAX_BACKOFF_SECONDS, EMAIL_BACKOFF_SECONDS * 2 ** (attempts - 1))
+        logger.warning(f"Email to {message['to']} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+        await self.outbox.update_one(
+            {"_id": message["_id"], "claim": message["claim"]},
+            {"$set": {**update, "status": "pending", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}, "$unset": {"claim": ""}}
+        )
+
+    async def dispatch_once(self):
+        batch = await self.claim_batch()
+        if batch:
+            await asyncio.gather(*(self.process(message) for message in batch))
+        return len(batch)
+
+    async def run(self):
+        if self.pool is None:
+            self.pool = SMTPPool()
+        try:
+            while True:
+                try:
+                    dispatched = await self.dispatch_once()
+                except Exception as e:
+                    logger.error(f"Email dispatch failed: {e}")
+                    dispatched = 0
+                if dispatched < EMAIL_BATCH_SIZE:
+                    await asyncio.sleep(EMAIL_POLL_SECONDS)
+        finally:
+            await self.pool.close()
+
+    async def queue_depth(self):
+        # Messages waiting or being sent, counted from the outbox so every
+        # worker reports it whether or not it runs the dispatcher
+        return await self.outbox.count_documents({"status": {"$in": ["pending", "sending"]}})
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "send_latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "send_latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else None
+        }
+
+
+dispatcher = EmailDispatcher()
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from itertools import count
+
+import orjson
+import settings  # noqa: F401  loads .env
+
+# Events buffered per connection before it is considered too slow and dropped
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("EVENT_STREAM_QUEUE_SIZE", 100))
+# Open streams allowed per worker
+EVENT_STREAM_MAX_SUBSCRIBERS = int(os.getenv("EVENT_STREAM_MAX_SUBSCRIBERS", 10000))
+EVENT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("EVENT_STREAM_HEARTBEAT_SECONDS", 25))
+
+# Delivered in place of the pending events when a subscriber falls behind;
+# the client is expected to refetch its list and reconnect.
+OVERFLOW = object()
+# Ends a stream whose token was revoked after it connected
+SIGNED_OUT = object()
+
+
+class Subscriber:
+    __slots__ = ("user_id", "is_admin", "queue", "overflowed")
+
+    def __init__(self, user_id, is_admin, queue_size):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class EventHub:
+    # In-process fan-out of task events to open streams. Admins receive every
+    # event, other users only events for tasks assigned to them, so a publish
+    # only touches the subscribers that will actually receive it.
+
+    def __init__(self, queue_size=EVENT_STREAM_QUEUE_SIZE, max_subscribers=EVENT_STREAM_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._admins = set()
+        self._by_user = {}
+        self._ids = count(1)
+        self.published = 0
+        self.dropped = 0
+        # Called with every published event so a shared backend can deliver
+        # it to streams held by the other workers
+        self._publishers = []
+
+    @property
+    def subscriber_count(self):
+        return len(self._admins) + sum(len(subs) for subs in self._by_user.values())
+
+    def subscribe(self, user_id, is_admin):
+        if self.subscriber_count >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(user_id, is_admin, self.queue_size)
+        if is_admin:
+            self._admins.add(subscriber)
+        else:
+            self._by_user.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber.is_admin:
+            self._admins.discard(subscriber)
+            return
+        subscribers = self._by_user.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_user[subscriber.user_id]
+
+    def has_audience(self, assigned_to):
+        # Streams on other workers are not known here, so with a publisher
+        # every event has a potential audience
+        return bool(self._publishers) or bool(self._admins) or assigned_to in self._by_user
+
+    def add_publisher(self, publisher):
+        self._publishers.append(publisher)
+
+    def publish(self, event_type, task, assigned_to):
+        for publisher in self._publishers:
+            publisher(event_type, task, assigned_to)
+        self.deliver(event_type, task, assigned_to)
+
+    def deliver(self, event_type, task, assigned_to):
+        # Fans an event out to the streams open on this worker
+        event = {"id": next(self._ids), "type": event_type, "task": task}
+        self.published += 1
+        audience = list(self._admins) + list(self._by_user.get(assigned_to, ()))
+        for subscriber in audience:
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._overflow(subscriber)
+
+    def _overflow(self, subscriber):
+        # Free the backlog right away and tell the stream to resync
+        self.unsubscribe(subscriber)
+        self.dropped += 1
+        subscriber.overflowed = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(OVERFLOW)
+
+    def close_all(self):
+        # Ends every open stream with a resync event so clients reconnect,
+        # to another worker when this one is shutting down
+        for subscriber in list(self._admins) + [s for subs in self._by_user.values() for s in subs]:
+            self.unsubscribe(subscriber)
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(OVERFLOW)
+
+    def stats(self):
+        return {
+            "subscribers": self.subscriber_count,
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+
+def format_sse(event):
+    if event is OVERFLOW:
+        return "event: resync\ndata: {}\n\n"
+    if event is SIGNED_OUT:
+        return "event: signed_out\ndata: {}\n\n"
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {orjson.dumps(event['task']).decode()}\n\n"
+
+
+hub = EventHub()
@@ -0,0 +1,67 @@
+import csv
+import io
+from datetime import datetime
+
+import orjson
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+EXPORT_FORMATS = ["ndjson", "csv"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+
+def check_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format. Must be one of: {EXPORT_FORMATS}"
+        )
+
+
+def flatten(row):
+    # Nested objects such as assigned_to become prefixed columns
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            for inner_key, inner_value in value.items():
+                flat[f"{key}_{inner_key}"] = inner_value
+        elif isinstance(value, datetime):
+            flat[key] = value.isoformat()
+        else:
+            flat[key] = value
+    return flat
+
+
+async def ndjson_chunks(batches):
+    async for batch in batches:
+        yield b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in batch)
+
+
+async def csv_chunks(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    async for batch in batches:
+        writer.writerows(flatten(row) for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(batches, export_format, columns, filename):
+    if export_format == "csv":
+        body = csv_chunks(batches, columns)
+    else:
+        body = ndjson_chunks(batches)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
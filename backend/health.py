@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+import time
+
+import settings  # noqa: F401  loads .env
+from database import ping
+from metrics import requests_in_flight
+
+logger = logging.getLogger(__name__)
+
+# A Mongo ping slower than this counts as a failure
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", 2))
+# Probes from several sources within this window share one ping
+HEALTH_CHECK_CACHE_SECONDS = float(os.getenv("HEALTH_CHECK_CACHE_SECONDS", 1))
+# Readiness fails as soon as Mongo is unreachable, taking the worker out of
+# rotation. Liveness only fails once it has been unreachable this long, so a
+# database outage does not have every replica restarted at once.
+HEALTH_LIVENESS_GRACE_SECONDS = float(os.getenv("HEALTH_LIVENESS_GRACE_SECONDS", 60))
+# After the exit signal the worker keeps serving with readiness failing. It
+# waits at least SHUTDOWN_READINESS_DELAY_SECONDS, so a load balancer
+# probing readiness stops routing to it, and at most SHUTDOWN_DRAIN_SECONDS
+# for requests in flight, before uvicorn stops accepting connections. Run
+# uvicorn with --timeout-graceful-shutdown so open connections cannot hold
+# it up longer after that.
+SHUTDOWN_READINESS_DELAY_SECONDS = float(os.getenv("SHUTDOWN_READINESS_DELAY_SECONDS", 0))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", 10))
+
+
+class Health:
+    def __init__(self):
+        self.started = False
+        self.draining = False
+        self.startup_seconds = 0.0
+        self._checked_at = None
+        self._mongo_ok = False
+        self._mongo_ok_at = None
+        self._lock = asyncio.Lock()
+        self.failed_checks = 0
+
+    def mark_started(self, startup_seconds):
+        self.started = True
+        self.draining = False
+        self.startup_seconds = startup_seconds
+        self._mongo_ok = True
+        self._checked_at = self._mongo_ok_at = time.monotonic()
+
+    async def check_mongo(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < HEALTH_CHECK_CACHE_SECONDS:
+                return self._mongo_ok
+            try:
+                await asyncio.wait_for(ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+                self._mongo_ok = True
+                self._mongo_ok_at = time.monotonic()
+            except Exception as e:
+                if self._mongo_ok:
+                    logger.warning(f"Mongo health check failed: {e}")
+                self._mongo_ok = False
+                self.failed_checks += 1
+            self._checked_at = time.monotonic()
+            return self._mongo_ok
+
+    async def readiness(self):
+        # (ok, reason)
+        if not self.started:
+            return False, "starting"
+        if self.draining:
+            return False, "draining"
+        if not await self.check_mongo():
+            return False, "database unreachable"
+        return True, "ok"
+
+    async def liveness(self):
+        if self.started and not await self.check_mongo():
+            if time.monotonic() - self._mongo_ok_at > HEALTH_LIVENESS_GRACE_SECONDS:
+                return False, "database unreachable"
+        return True, "ok"
+
+    async def drain(self, timeout=SHUTDOWN_DRAIN_SECONDS):
+        # Fails readiness from now on and waits for requests in flight
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        await asyncio.sleep(min(SHUTDOWN_READINESS_DELAY_SECONDS, timeout))
+        while requests_in_flight.value > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if requests_in_flight.value > 0:
+            logger.warning(f"Shutting down with {requests_in_flight.value} requests still in flight")
+
+    def stats(self):
+        return {
+            "ready": int(self.started and not self.draining and self._mongo_ok),
+            "startup_seconds": self.startup_seconds,
+            "failed_checks": self.failed_checks
+        }
+
+
+health = Health()
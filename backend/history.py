@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, time
+
+import settings  # noqa: F401  loads .env
+from pymongo import ASCENDING, DESCENDING
+
+from database import database
+from models import TASK_STATUSES
+from lease import Lease
+from http_cache import versions, ANALYTICS
+
+logger = logging.getLogger(__name__)
+
+# Raw events are kept this long; the daily rollups are kept for good
+TASK_EVENT_RETENTION_DAYS = int(os.getenv("TASK_EVENT_RETENTION_DAYS", 90))
+# Events are buffered and written in batches, at least this often
+TASK_HISTORY_FLUSH_SECONDS = float(os.getenv("TASK_HISTORY_FLUSH_SECONDS", 1))
+TASK_HISTORY_BATCH_SIZE = int(os.getenv("TASK_HISTORY_BATCH_SIZE", 500))
+# While the database is unreachable the oldest buffered events are dropped
+# beyond this many
+TASK_HISTORY_MAX_BUFFERED = int(os.getenv("TASK_HISTORY_MAX_BUFFERED", 50000))
+# How often today's rollups are recomputed; analytics lag by up to this much
+TASK_ROLLUP_SECONDS = float(os.getenv("TASK_ROLLUP_SECONDS", 300))
+
+# A time series collection keyed by assigned_to, see migration 9
+event_collection = database.get_collection("task_events")
+rollup_collection = database.get_collection("task_daily_rollups")
+
+
+def day_start(at):
+    return datetime.combine(at.date(), time())
+
+
+def week_start(day):
+    # Weeks start on Monday
+    return day_start(day) - timedelta(days=day.weekday())
+
+
+def _seconds_since(at, since):
+    if isinstance(since, datetime):
+        return (at - since).total_seconds()
+    return None
+
+
+def created_event(task, by):
+    return {
+        "at": task["created_at"],
+        "assigned_to": task["assigned_to"],
+        "task_id": task["_id"],
+        "type": "created",
+        "to": task.get("status", "pending"),
+        "by": by
+    }
+
+
+def status_event(task, old_status, new_status, at, by):
+    # task is the document before the change; it needs created_at and
+    # status_changed_at for the durations
+    event = {
+        "at": at,
+        "assigned_to": task["assigned_to"],
+        "task_id": task["_id"],
+        "type": "status_changed",
+        "from": old_status,
+        "to": new_status,
+        "by": by
+    }
+    entered_at = task.get("status_changed_at") or task.get("created_at")
+    seconds_in_status = _seconds_since(at, entered_at)
+    if seconds_in_status is not None:
+        event["seconds_in_status"] = seconds_in_status
+    if new_status == "completed":
+        cycle_seconds = _seconds_since(at, task.get("created_at"))
+        if cycle_seconds is not None:
+            event["cycle_seconds"] = cycle_seconds
+    return event
+
+
+class TaskHistory:
+    # Append-only log of task changes. Routes record events in memory and a
+    # background task writes them in batches, so a status update costs no
+    # extra round trip. Events still buffered when a worker dies are lost.
+
+    def __init__(self, collection=event_collection, batch_size=TASK_HISTORY_BATCH_SIZE, max_buffered=TASK_HISTORY_MAX_BUFFERED):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self._buffer = []
+        # Set by record() once a batch is ready; created by run() on its loop
+        self._full = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(self, *events):
+        self._buffer.extend(events)
+        overflow = len(self._buffer) - self.max_buffered
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+        if self._full is not None and len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def flush(self):
+        while self._buffer:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+            except Exception:
+                # Retried whole with the next flush; a partly written batch
+                # leaves a few duplicate events rather than gaps
+                self._buffer[:0] = batch
+                raise
+            self.written += len(batch)
+
+    async def run(self, interval=TASK_HISTORY_FLUSH_SECONDS):
+        self._full = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Task history flush failed: {e}")
+
+    async def for_task(self, task):
+        # Events of one task, oldest first. Tasks keep their assignee, so the
+        # query stays within that assignee's buckets.
+        cursor = self.collection.find(
+            {"assigned_to": task["assigned_to"], "task_id": task["_id"]},
+            {"_id": 0, "assigned_to": 0, "task_id": 0}
+        ).sort("at", ASCENDING)
+        return await cursor.to_list(None)
+
+    def stats(self):
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes
+        }
+
+
+history = TaskHistory()
+
+
+def _count(condition):
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+
+def _total(condition, field):
+    return {"$sum": {"$cond": [condition, {"$ifNull": [field, 0]}, 0]}}
+
+
+def rollup_pipeline(day):
+    # Per assignee totals for one day of events, merged into the rollup
+    # collection on the server. Recomputing a day replaces its rollups, so
+    # passes can repeat.
+    completed = {"$eq": ["$to", "completed"]}
+    has_cycle = {"$and": [completed, {"$gt": ["$cycle_seconds", None]}]}
+    group = {
+        "_id": "$assigned_to",
+        "created": _count({"$eq": ["$type", "created"]}),
+        "completed": _count({"$and": [{"$eq": ["$type", "status_changed"]}, completed]}),
+        "reopened": _count({"$eq": ["$from", "completed"]}),
+        "cycle_count": _count(has_cycle),
+        "cycle_seconds": _total(has_cycle, "$cycle_seconds")
+    }
+    time_in_status = {}
+    for task_status in TASK_STATUSES:
+        left = {"$and": [{"$eq": ["$from", task_status]}, {"$gt": ["$seconds_in_status", None]}]}
+        group[f"{task_status}_exits"] = _count(left)
+        group[f"{task_status}_seconds"] = _total(left, "$seconds_in_status")
+        time_in_status[task_status] = {"exits": f"${task_status}_exits", "seconds": f"${task_status}_seconds"}
+
+    return [
+        {"$match": {"at": {"$gte": day, "$lt": day + timedelta(days=1)}}},
+        {"$group": group},
+        {"$project": {
+            "_id": {"day": day, "assigned_to": "$_id"},
+            "day": day,
+            "week": week_start(day),
+            "assigned_to": "$_id",
+            "created": 1,
+            "completed": 1,
+            "reopened": 1,
+            "cycle_count": 1,
+            "cycle_seconds": 1,
+            "time_in_status": time_in_status
+        }},
+        {"$merge": {"into": rollup_collection.name, "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+
+class DailyRollups:
+    # Keeps one document per assignee per day with the totals the analytics
+    # endpoints read, so requests never scan raw events. One worker at a
+    # time, holding the lease, recomputes today and any day not yet final.
+
+    def __init__(self, events=event_collection, rollups=rollup_collection, lease=None):
+        self.events = events
+        self.rollups = rollups
+        self.lease = lease or Lease("task_rollups", ttl=TASK_ROLLUP_SECONDS * 2)
+        # Days before this one are final on this worker
+        self._open_day = None
+        self.passes = 0
+        self.last_pass_seconds = 0.0
+
+    async def days_to_roll_up(self, today):
+        start = self._open_day
+        if start is None:
+            # First pass here: resume after the last day any worker rolled up
+            latest = await self.rollups.find_one({}, {"day": 1}, sort=[("day", DESCENDING)])
+            if latest is not None:
+                start = latest["day"]
+            else:
+                first = await self.events.find_one({}, {"at": 1}, sort=[("at", ASCENDING)])
+                start = day_start(first["at"]) if first else today
+        days = []
+        day = min(start, today)
+        while day <= today:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    async def roll_up(self):
+        started = datetime.utcnow()
+        today = day_start(started)
+        # Yesterday is recomputed once more after midnight, which picks up
+        # events that were still buffered when the day ended
+        for day in await self.days_to_roll_up(today):
+            await self.events.aggregate(rollup_pipeline(day)).to_list(None)
+        self._open_day = today
+        self.passes += 1
+        self.last_pass_seconds = (datetime.utcnow() - started).total_seconds()
+        await versions.bump(ANALYTICS)
+
+    async def run(self, interval=TASK_ROLLUP_SECONDS):
+        try:
+            while True:
+                try:
+                    if await self.lease.acquire():
+                        await self.roll_up()
+                except Exception as e:
+                    logger.error(f"Task rollup failed: {e}")
+                await asyncio.sleep(interval)
+        finally:
+            await self.lease.release()
+
+    def stats(self):
+        return {
+            "is_leader": int(self.lease.is_held),
+            "passes": self.passes,
+            "last_pass_seconds": self.last_pass_seconds
+        }
+
+
+rollups = DailyRollups()
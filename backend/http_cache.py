@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+import settings  # noqa: F401  loads .env
+from fastapi import Request, Response
+from pymongo import UpdateOne
+
+from database import database
+from pagination import page_response
+
+logger = logging.getLogger(__name__)
+
+# How often each worker pulls version bumps made by other workers; until then
+# it may answer 304 for data another worker just changed
+HTTP_CACHE_SYNC_SECONDS = float(os.getenv("HTTP_CACHE_SYNC_SECONDS", 1))
+# Lists read through the analytics_* handles may come from a secondary, so
+# for this long after a write their responses may not reflect it yet and are
+# sent without an ETag. Primary reads pass settle=0.
+HTTP_CACHE_SETTLE_SECONDS = float(os.getenv("HTTP_CACHE_SETTLE_SECONDS", 5))
+# Each sync re-reads this far back so clock skew between writers cannot
+# hide a bump
+HTTP_CACHE_SYNC_OVERLAP = timedelta(seconds=30)
+
+# Responses are per user and must be revalidated on every use
+CACHE_CONTROL = "private, no-cache"
+
+versions_collection = database.get_collection("cache_versions")
+
+# Version keys. Every task write bumps TASKS and the assignee's key, user
+# writes bump USERS, STATS covers counters changed outside those writes and
+# ANALYTICS the daily task rollups.
+TASKS = "tasks"
+USERS = "users"
+STATS = "stats"
+ANALYTICS = "analytics"
+
+
+def user_tasks_key(user_id):
+    return f"tasks:{user_id}"
+
+
+class VersionStamps:
+    # One stamp per key, replaced by a fresh ObjectId on every write to the
+    # data it covers. Responses carry an ETag derived from the stamps, so a
+    # conditional request is answered from memory.
+
+    def __init__(self, collection=versions_collection):
+        self.collection = collection
+        self._stamps = {}  # key -> (stamp, changed_at)
+        self._synced_at = None
+        # Called with {key: (stamp, changed_at)} after every bump so a shared
+        # backend can forward it to the other workers ahead of their next sync
+        self._publishers = []
+
+    def stamp(self, key):
+        return self._stamps.get(key, ("0", None))
+
+    async def bump(self, *keys):
+        if not keys:
+            return
+        now = datetime.utcnow()
+        updates = []
+        bumped = {}
+        for key in set(keys):
+            stamp = str(ObjectId())
+            self._stamps[key] = bumped[key] = (stamp, now)
+            updates.append(UpdateOne({"_id": key}, {"$set": {"stamp": stamp, "changed_at": now}}, upsert=True))
+        await self.collection.bulk_write(updates, ordered=False)
+        for publisher in self._publishers:
+            publisher(bumped)
+
+    def apply(self, stamps):
+        for key, (stamp, changed_at) in stamps.items():
+            self._stamps[key] = (stamp, changed_at)
+
+    def add_publisher(self, publisher):
+        self._publishers.append(publisher)
+
+    def etag(self, request: Request, *keys, settle=0):
+        # Strong validator for the response to this URL, or None while one of
+        # the keys changed too recently to be sure the read reflects it
+        now = datetime.utcnow()
+        digest = hashlib.blake2b(request.url.path.encode(), digest_size=16)
+        digest.update(request.url.query.encode())
+        # The overdue filter and flags depend on the date
+        digest.update(now.date().isoformat().encode())
+        # Gzip is applied per request, so each encoding gets its own tag
+        digest.update(b"gzip" if "gzip" in request.headers.get("accept-encoding", "") else b"identity")
+        for key in keys:
+            stamp, changed_at = self.stamp(key)
+            if changed_at is not None and (now - changed_at).total_seconds() < settle:
+                return None
+            digest.update(f"\0{key}={stamp}".encode())
+        return f'"{digest.hexdigest()}"'
+
+    async def sync(self):
+        query = {}
+        if self._synced_at is not None:
+            query = {"changed_at": {"$gte": self._synced_at - HTTP_CACHE_SYNC_OVERLAP}}
+        async for entry in self.collection.find(query):
+            self._stamps[entry["_id"]] = (entry["stamp"], entry["changed_at"])
+            if self._synced_at is None or entry["changed_at"] > self._synced_at:
+                self._synced_at = entry["changed_at"]
+
+    async def sync_periodically(self, interval=HTTP_CACHE_SYNC_SECONDS):
+        # The first sync runs at startup, before requests are served
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Cache version sync failed: {e}")
+
+    def stats(self):
+        return {"keys": len(self._stamps)}
+
+
+versions = VersionStamps()
+
+
+def is_fresh(request: Request, etag):
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    if etag is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_cache_headers(response: Response, etag):
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def cached_page(items, next_cursor, etag):
+    response = page_response(items, next_cursor)
+    set_cache_headers(response, etag)
+    return response
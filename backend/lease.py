@@ -0,0 +1,52 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from database import database
+
+# Shared by every lease; named after its first user
+lease_collection = database.get_collection("scheduler_leases")
+
+
+class Lease:
+    # Leader election over a Mongo document: the holder renews it well before
+    # expires_at and anyone may take it once it has expired. Assumes worker
+    # clocks agree to well within the lease length.
+
+    def __init__(self, name, ttl, collection=lease_collection):
+        self.name = name
+        self.ttl = ttl
+        self.collection = collection
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held_until = 0.0
+
+    @property
+    def is_held(self):
+        return time.monotonic() < self._held_until
+
+    async def acquire(self):
+        # Takes the lease if it is free or expired, renews it if already held
+        start = time.monotonic()
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"holder": self.holder, "expires_at": now + timedelta(seconds=self.ttl), "renewed_at": now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Held by someone else: the filter missed and the upsert collided
+            self._held_until = 0.0
+            return False
+        # Measured from before the request so the local view expires first
+        self._held_until = start + self.ttl
+        return True
+
+    async def release(self):
+        if self.is_held:
+            self._held_until = 0.0
+            await self.collection.delete_one({"_id": self.name, "holder": self.holder})
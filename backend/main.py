@@ -1,44 +1,238 @@
+import settings  # noqa: F401  loads .env
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.auth import router as AuthRouter
 from routes.tasks import router as TaskRouter
-from database import client
+from routes.events import router as EventRouter
+from routes.metrics import router as MetricsRouter
+from routes.analytics import router as AnalyticsRouter
+from routes.health import router as HealthRouter
+from metrics import MetricsMiddleware, label_routes
+from ratelimit import RateLimitMiddleware
+from database import connect, close
+from migrations import apply_migrations
+from hashing import hash_pool
+from stats import reconcile_periodically
+from emails import dispatcher
+from events import hub
+from revocation import revocations
+from scheduler import scheduler
+from http_cache import versions
+from history import history, rollups
+from health import health
+from cache import user_cache
+from bus import bus
+from starlette.middleware.gzip import GZipMiddleware
+import asyncio
 import logging
+import os
+import signal
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compresses large list and export bodies; 0 turns it off, e.g. behind a
+# proxy that already compresses
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", 1024))
+# Set to false when running email_worker.py as a separate process
+EMAIL_DISPATCHER_IN_APP = os.getenv("EMAIL_DISPATCHER_IN_APP", "true").lower() == "true"
+# Set to false when running scheduler_worker.py as a separate process.
+# Every worker may run it; a Mongo lease keeps a single one sweeping.
+SCHEDULER_IN_APP = os.getenv("SCHEDULER_IN_APP", "true").lower() == "true"
 
-app = FastAPI(title="Task Manager API")
+# The components are process-wide, so they are connected to the bus once
+# even when several apps are started in one process
+bus_shared = False
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "https://taskmanager-liard-ten.vercel.app",
-        "http://localhost:3000",
-        "http://localhost:8000",
-        "http://127.0.0.1:8000",
-        "http://127.0.0.1:5500",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-app.include_router(AuthRouter, tags=["Authentication"], prefix="/auth")
-app.include_router(TaskRouter, tags=["Tasks"], prefix="/tasks")
+def share_state_over_bus():
+    # Each worker keeps its own user cache, revocation list, ETag stamps and
+    # event streams. Local changes to them are published on the bus and
+    # other workers' changes applied here, within milliseconds instead of
+    # a sync interval. The periodic syncs stay on as a safety net.
+    global bus_shared
+    if bus_shared:
+        return
+    bus_shared = True
+    user_cache.add_publisher(lambda key: bus.publish("user_cache", {"key": key}))
+    bus.subscribe("user_cache", lambda data: user_cache.invalidate(data["key"], publish=False))
+    revocations.add_publisher(lambda entry: bus.publish("revocation", entry))
+    bus.subscribe("revocation", revocations.apply)
+    versions.add_publisher(lambda stamps: bus.publish("cache_version", stamps))
+    bus.subscribe("cache_version", versions.apply)
+    hub.add_publisher(lambda event_type, task, assigned_to: bus.publish(
+        "task_event", {"type": event_type, "task": task, "assigned_to": assigned_to}
+    ))
+    bus.subscribe("task_event", lambda data: hub.deliver(data["type"], data["task"], data["assigned_to"]))
 
-@app.on_event("startup")
-async def startup_db_client():
+    async def clear_user_cache():
+        user_cache.clear()
+
+    bus.on_resync(revocations.sync)
+    bus.on_resync(versions.sync)
+    bus.on_resync(clear_user_cache)
+
+
+# Drains started by an exit signal, referenced until they finish
+exit_drains = set()
+
+
+def drain_on_exit_signal():
+    # On SIGTERM/SIGINT uvicorn stops accepting connections and waits for the
+    # open ones before the lifespan shutdown runs, and event streams never
+    # finish on their own. Its handlers are wrapped so the worker first fails
+    # readiness, ends the streams and lets requests in flight finish while
+    # still serving, then hands the signal on. Only the main thread receives
+    # signals, and only uvicorn's handlers installed with signal.signal are
+    # wrapped.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+
+    async def drain_then_exit(exit_handler, signum, frame):
+        hub.close_all()
+        await health.drain()
+        exit_handler(signum, frame)
+
+    def start_drain(exit_handler, signum, frame):
+        task = loop.create_task(drain_then_exit(exit_handler, signum, frame))
+        exit_drains.add(task)
+        task.add_done_callback(exit_drains.discard)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        exit_handler = signal.getsignal(sig)
+        if not callable(exit_handler):
+            continue
+
+        def on_exit_signal(signum, frame, exit_handler=exit_handler):
+            if health.draining:
+                # A second signal exits without waiting
+                exit_handler(signum, frame)
+                return
+            health.draining = True
+            loop.call_soon_threadsafe(start_drain, exit_handler, signum, frame)
+
+        signal.signal(sig, on_exit_signal)
+
+
+def start_background_tasks():
+    tasks = {
+        # Revocations and the version stamps behind the list ETags made by
+        # other workers reach this one within a sync interval even without
+        # the bus
+        "revocation_sync": revocations.sync_periodically(),
+        "cache_version_sync": versions.sync_periodically(),
+        # Keeps the dashboard counters from drifting; one worker at a time
+        # holds its lease, and its first pass runs now
+        "stats_reconciler": reconcile_periodically(),
+        # Writes buffered task events; rollups run on whichever worker holds
+        # their lease
+        "task_history_writer": history.run(),
+        "task_rollups": rollups.run(),
+        "invalidation_bus": bus.run(),
+    }
+    if EMAIL_DISPATCHER_IN_APP:
+        tasks["email_dispatcher"] = dispatcher.run()
+    if SCHEDULER_IN_APP:
+        tasks["due_date_scheduler"] = scheduler.run()
+    return {name: asyncio.create_task(coroutine, name=name) for name, coroutine in tasks.items()}
+
+
+async def stop_background_tasks(tasks):
+    # Awaited so their cleanup (lease releases, SMTP sessions) runs while
+    # the Mongo client is still open
+    for task in tasks.values():
+        task.cancel()
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A worker that cannot reach Mongo or migrate fails to start instead of
+    # serving errors; the process manager restarts it
+    start = time.perf_counter()
+    await connect()
+    connected = time.perf_counter()
+    version = await apply_migrations()
+    migrated = time.perf_counter()
+    # Opened before the initial syncs so no change made in between is missed
+    if await bus.open():
+        share_state_over_bus()
+    await asyncio.gather(revocations.sync(), versions.sync())
+    app.state.background_tasks = start_background_tasks()
+    drain_on_exit_signal()
+    ready = time.perf_counter()
+    health.mark_started(ready - start)
+    logger.info(
+        f"Ready in {ready - start:.3f}s at migration version {version} "
+        f"(connect {connected - start:.3f}s, migrations {migrated - connected:.3f}s, sync {ready - migrated:.3f}s)"
+    )
+
+    yield
+
+    # Normally already done when the exit signal arrived; covers servers
+    # that shut down without one
+    if not health.draining:
+        hub.close_all()
+        await health.drain()
+    await stop_background_tasks(app.state.background_tasks)
     try:
-        # The ping command is cheap and does not require auth.
-        await client.admin.command('ping')
-        logger.info("Successfully connected to MongoDB")
+        # Before the client closes, so buffered events and invalidations are
+        # not lost on a deploy
+        await history.flush()
+        await bus.flush()
     except Exception as e:
-        logger.error(f"Could not connect to MongoDB: {e}")
+        logger.error(f"Could not write buffered task events: {e}")
+    hash_pool.shutdown()
+    close()
+
+
+def create_app():
+    app = FastAPI(title="Task Manager API", lifespan=lifespan)
+
+    # Innermost of the middlewares, so rejections still get CORS headers and
+    # are counted in the metrics
+    app.add_middleware(RateLimitMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "https://taskmanager-liard-ten.vercel.app",
+            "http://localhost:3000",
+            "http://localhost:8000",
+            "http://127.0.0.1:8000",
+            "http://127.0.0.1:5500",
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Server-Timing", "X-DB-Queries", "ETag", "Retry-After"],
+    )
+    app.add_middleware(MetricsMiddleware)
+    if GZIP_MINIMUM_SIZE > 0:
+        app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=6)
+
+    routers = [
+        (AuthRouter, "Authentication", "/auth"),
+        (TaskRouter, "Tasks", "/tasks"),
+        (EventRouter, "Events", "/events"),
+        (AnalyticsRouter, "Analytics", "/analytics"),
+        (HealthRouter, "Health", "/health"),
+        (MetricsRouter, "Metrics", ""),
+    ]
+    for router, tag, prefix in routers:
+        app.include_router(router, tags=[tag], prefix=prefix)
+        # Metrics label requests with the full path template
+        label_routes(router, prefix)
+
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def root():
+        return {"message": "Welcome to the Task Manager API"}
+
+    return app
 
 
-@app.api_route("/", methods=["GET", "HEAD"])
-async def root():
-    return {"message": "Welcome to the Task Manager API"}
+app = create_app()
@@ -0,0 +1,318 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+import settings  # noqa: F401  loads .env
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Mongo commands slower than this are logged with the route that issued them
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", 100))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    # Cumulative Prometheus histogram keyed by a tuple of label values. The
+    # command listener observes from Motor's executor threads, hence the lock.
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                base = _labels(self.label_names, labels)
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{base}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{base}}} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+class Gauge:
+    # Unlabelled value that goes up and down; only touched from the event loop
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Time until the response is complete", ("method", "route"), LATENCY_BUCKETS
+)
+request_count = Counter("http_requests_total", "Requests by route and status code", ("method", "route", "status"))
+request_queries = Histogram(
+    "http_request_mongo_commands", "Mongo commands issued per request", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+mongo_latency = Histogram(
+    "mongo_command_duration_seconds", "Mongo command round trip time", ("command", "collection"), LATENCY_BUCKETS
+)
+mongo_failures = Counter("mongo_command_failures_total", "Failed Mongo commands", ("command", "collection"))
+mongo_pool_wait = Histogram(
+    "mongo_pool_wait_seconds", "Time spent waiting to check out a pooled connection", ("address",), LATENCY_BUCKETS
+)
+requests_in_flight = Gauge("http_requests_in_flight", "Requests being handled, not counting event streams")
+mongo_slow = Counter("mongo_slow_commands_total", f"Mongo commands slower than {MONGO_SLOW_QUERY_MS:g}ms", ("command", "collection"))
+
+
+# Full path template by route object. Routers included with a prefix hand
+# their own route objects to the scope, whose path lacks the prefix.
+route_templates = {}
+
+
+def label_routes(router, prefix=""):
+    for route in router.routes:
+        path = getattr(route, "path", None)
+        if path is not None:
+            route_templates[id(route)] = prefix + path
+
+
+class RequestMetrics:
+    __slots__ = ("scope", "db_commands", "db_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.db_commands = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self):
+        # The router records the matched route in the scope; unmatched paths
+        # share one label instead of one series per URL
+        route = self.scope.get("route")
+        if route is None:
+            return "unmatched"
+        return route_templates.get(id(route)) or getattr(route, "path", None) or "unmatched"
+
+
+# Set for the duration of each HTTP request. Motor copies the context into
+# its executor threads, so the command listener sees the request it serves.
+current_request = ContextVar("current_request", default=None)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        # (connection_id, request_id) -> collection, between started and
+        # succeeded/failed; the finished events do not carry the command
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        mongo_failures.inc((event.command_name, self._pending.get((event.connection_id, event.request_id), "")))
+        self._finish(event)
+
+    def _finish(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        mongo_latency.observe((event.command_name, collection), seconds)
+
+        request = current_request.get()
+        if request is not None:
+            request.db_commands += 1
+            request.db_seconds += seconds
+
+        if seconds * 1000 >= MONGO_SLOW_QUERY_MS:
+            mongo_slow.inc((event.command_name, collection))
+            route = request.route if request is not None else "-"
+            logger.warning(f"Slow Mongo {event.command_name} on {collection or '-'}: {seconds * 1000:.1f}ms (route {route})")
+
+
+command_listener = MongoCommandListener()
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    # Connection pool utilization across all servers. Each uvicorn worker has
+    # its own pools, so the database sees up to workers * maxPoolSize
+    # connections per server.
+
+    def __init__(self):
+        self.max_pool_size = 0
+        self.pools = set()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self._lock = threading.Lock()
+
+    def pool_created(self, event):
+        with self._lock:
+            self.pools.add(event.address)
+            self.max_pool_size = event.options.get("maxPoolSize", self.max_pool_size)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools.discard(event.address)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+        mongo_pool_wait.observe((_address(event.address),), event.duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+        mongo_pool_wait.observe((_address(event.address),), event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self):
+        return {
+            "pools": len(self.pools),
+            "max_pool_size": self.max_pool_size,
+            "open_connections": self.open_connections,
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak_checked_out,
+            "checkout_failures": self.checkout_failures,
+            "pool_clears": self.pool_clears
+        }
+
+
+def _address(address):
+    host, port = address
+    return f"{host}:{port}"
+
+
+pool_monitor = MongoPoolMonitor()
+
+
+class MetricsMiddleware:
+    # Pure ASGI middleware so streaming responses (SSE, exports, bulk NDJSON)
+    # pass through untouched. Routes are labelled by their path template to
+    # keep the number of series bounded.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics(scope)
+        token = current_request.set(metrics)
+        start = time.perf_counter()
+        status_code = 500
+        # Event streams stay open indefinitely and are not waited for when
+        # the worker drains
+        counted = not scope["path"].startswith("/events/")
+        if counted:
+            requests_in_flight.value += 1
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # DB time spent before the response started; for streaming
+                # responses later queries are only counted in /metrics
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"db;dur={metrics.db_seconds * 1000:.2f}".encode()))
+                headers.append((b"x-db-queries", str(metrics.db_commands).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if counted:
+                requests_in_flight.value -= 1
+            current_request.reset(token)
+            labels = (scope["method"], metrics.route)
+            request_latency.observe(labels, time.perf_counter() - start)
+            request_count.inc(labels + (str(status_code),))
+            request_queries.observe(labels, metrics.db_commands)
+
+
+def render_metrics(gauges=None):
+    # gauges: {metric name: value} for point-in-time component stats
+    lines = []
+    for metric in (request_latency, request_count, request_queries, requests_in_flight, mongo_latency, mongo_failures, mongo_slow, mongo_pool_wait):
+        lines.extend(metric.render())
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+from database import database
+from models import ACTIVE_STATUSES, naive_utc
+from queries import assignee_snapshot, user_search_terms, UNKNOWN_ASSIGNEE
+from scheduler import overdue_at, schedule_fields
+from history import TASK_EVENT_RETENTION_DAYS
+from bus import INVALIDATION_BUS_SIZE_BYTES
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# Data migrations touch this many documents per round trip and pause between
+# batches so they can run against a live collection
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 1000))
+MIGRATION_BATCH_PAUSE_SECONDS = float(os.getenv("MIGRATION_BATCH_PAUSE_SECONDS", 0.05))
+
+
+async def create_initial_indexes(db):
+    users = db.get_collection("users")
+    tasks = db.get_collection("tasks")
+
+    # get_current_user, login_user and register_user look users up by email
+    await users.create_index([("email", ASCENDING)], unique=True, name="email_unique")
+    # Non-admin count on the stats endpoint
+    await users.create_index([("role", ASCENDING)], name="role")
+    # /tasks/my, delete_user's assigned-task count and assignee filters
+    await tasks.create_index(
+        [("assigned_to", ASCENDING), ("status", ASCENDING), ("due_date", ASCENDING)],
+        name="assigned_to_status_due_date"
+    )
+    # /tasks/active, /tasks/completed and the stats counts
+    await tasks.create_index(
+        [("status", ASCENDING), ("created_at", DESCENDING)],
+        name="status_created_at"
+    )
+
+
+async def create_email_outbox_indexes(db):
+    outbox = db.get_collection("email_outbox")
+    # Dispatcher claim query
+    await outbox.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at")
+    await outbox.create_index([("claim", ASCENDING)], name="claim", sparse=True)
+    # Delivered messages are kept for a week for troubleshooting
+    await outbox.create_index([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=7 * 24 * 3600)
+
+
+async def convert_task_assignees(db, batch_size=None, pause=None):
+    # assigned_to string -> ObjectId plus an assignee snapshot, in small
+    # batches. Resumable: only unconverted tasks match, and each update is
+    # conditional on the value it read, so an interrupted or concurrent run
+    # just continues. The API reads both forms while this runs.
+    batch_size = batch_size or MIGRATION_BATCH_SIZE
+    pause = MIGRATION_BATCH_PAUSE_SECONDS if pause is None else pause
+    tasks = db.get_collection("tasks")
+    users = db.get_collection("users")
+    pending = {"$or": [{"assigned_to": {"$type": "string"}}, {"assignee": {"$exists": False}}]}
+
+    last_id = None
+    converted = 0
+    while True:
+        query = pending if last_id is None else {"$and": [pending, {"_id": {"$gt": last_id}}]}
+        batch = await tasks.find(query, {"assigned_to": 1}).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        user_ids = {ObjectId(str(task["assigned_to"])) for task in batch if ObjectId.is_valid(str(task.get("assigned_to")))}
+        assignees = {}
+        async for user in users.find({"_id": {"$in": list(user_ids)}}, {"fullname": 1, "email": 1}):
+            assignees[user["_id"]] = user
+
+        updates = []
+        for task in batch:
+            if not ObjectId.is_valid(str(task.get("assigned_to"))):
+                # Nothing to point at; left as is
+                continue
+            user_id = ObjectId(str(task["assigned_to"]))
+            user = assignees.get(user_id)
+            updates.append(UpdateOne(
+                {"_id": task["_id"], "assigned_to": task["assigned_to"]},
+                {"$set": {"assigned_to": user_id, "assignee": assignee_snapshot(user) if user else UNKNOWN_ASSIGNEE}}
+            ))
+        if updates:
+            result = await tasks.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+            logger.info(f"Converted {converted} task assignees")
+        await asyncio.sleep(pause)
+
+
+async def create_search_indexes(db, batch_size=None, pause=None):
+    batch_size = batch_size or MIGRATION_BATCH_SIZE
+    pause = MIGRATION_BATCH_PAUSE_SECONDS if pause is None else pause
+    tasks = db.get_collection("tasks")
+    users = db.get_collection("users")
+
+    # /tasks/search, ranked with title matches above description matches
+    await tasks.create_index(
+        [("title", TEXT), ("description", TEXT), ("assignee.fullname", TEXT)],
+        weights={"title": 10, "description": 2, "assignee.fullname": 1},
+        name="title_description_assignee_text"
+    )
+
+    # /auth/users/search prefix-matches the search_terms array. Resumable
+    # backfill; each update only applies if the name and email are unchanged.
+    last_id = None
+    while True:
+        query = {"search_terms": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await users.find(query, {"fullname": 1, "email": 1}).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        await users.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": user["_id"], "fullname": user["fullname"], "email": user["email"]},
+                    {"$set": {"search_terms": user_search_terms(user["fullname"], user["email"])}}
+                )
+                for user in batch
+            ],
+            ordered=False
+        )
+        await asyncio.sleep(pause)
+    await users.create_index([("search_terms", ASCENDING)], name="search_terms")
+
+
+async def create_revocation_indexes(db):
+    revoked = db.get_collection("revoked_tokens")
+    # Entries are removed once every token they cover has expired
+    await revoked.create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+    # Workers poll for entries added since their last sync
+    await revoked.create_index([("created_at", ASCENDING)], name="created_at")
+
+
+async def convert_due_dates(db, batch_size=None, pause=None):
+    # ISO date strings -> datetimes, putting active tasks on the scheduler's
+    # queue. Tasks already overdue are flagged without a notification, so the
+    # first sweep does not email every assignee with an old task. Resumable
+    # like convert_task_assignees; unparseable dates are left as they are.
+    batch_size = batch_size or MIGRATION_BATCH_SIZE
+    pause = MIGRATION_BATCH_PAUSE_SECONDS if pause is None else pause
+    tasks = db.get_collection("tasks")
+    pending = {"due_date": {"$type": "string"}}
+    now = datetime.utcnow()
+
+    last_id = None
+    converted = 0
+    while True:
+        query = pending if last_id is None else {"$and": [pending, {"_id": {"$gt": last_id}}]}
+        batch = await tasks.find(query, {"due_date": 1, "status": 1}).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        updates = []
+        for task in batch:
+            try:
+                due_date = naive_utc(datetime.fromisoformat(task["due_date"]))
+            except ValueError:
+                continue
+            fields = {"due_date": due_date}
+            if task.get("status", "pending") in ACTIVE_STATUSES:
+                if overdue_at(due_date) <= now:
+                    fields["overdue_at"] = now
+                else:
+                    fields.update(schedule_fields(due_date))
+            updates.append(UpdateOne({"_id": task["_id"], "due_date": task["due_date"]}, {"$set": fields}))
+        if updates:
+            result = await tasks.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+            logger.info(f"Converted {converted} task due dates")
+        await asyncio.sleep(pause)
+
+    # The scheduler's queue; only tasks with a pending reminder or overdue
+    # check are indexed
+    await tasks.create_index([("next_check_at", ASCENDING)], name="next_check_at", sparse=True)
+    # Overdue filter and the stats overdue count
+    await tasks.create_index([("status", ASCENDING), ("due_date", ASCENDING)], name="status_due_date")
+
+
+async def create_cache_version_indexes(db):
+    # Workers poll for version stamps changed since their last sync
+    await db.get_collection("cache_versions").create_index([("changed_at", ASCENDING)], name="changed_at")
+
+
+async def create_rate_limit_indexes(db):
+    # Only used with RATE_LIMIT_BACKEND=mongo; idle buckets are full again
+    # by expires_at and are dropped
+    await db.get_collection("rate_limits").create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+
+
+async def create_task_history_collections(db):
+    # Task events go to a time series collection (MongoDB 5.0+) bucketed per
+    # assignee, which stores them compactly and expires whole buckets.
+    # Older servers get a plain collection with a TTL index instead.
+    retention = TASK_EVENT_RETENTION_DAYS * 24 * 3600
+    events = db.get_collection("task_events")
+    try:
+        await db.create_collection(
+            "task_events",
+            timeseries={"timeField": "at", "metaField": "assigned_to", "granularity": "hours"},
+            expireAfterSeconds=retention
+        )
+    except CollectionInvalid:
+        # Created by another worker
+        pass
+    except OperationFailure:
+        await events.create_index([("at", ASCENDING)], name="at_ttl", expireAfterSeconds=retention)
+    # Task history and the daily rollup scans
+    await events.create_index([("assigned_to", ASCENDING), ("at", ASCENDING)], name="assigned_to_at")
+
+    rollups = db.get_collection("task_daily_rollups")
+    # Analytics date ranges, optionally for one assignee
+    await rollups.create_index([("day", ASCENDING)], name="day")
+    await rollups.create_index([("assigned_to", ASCENDING), ("day", ASCENDING)], name="assigned_to_day")
+
+
+async def create_invalidation_bus(db):
+    # Capped, so old messages are overwritten in place instead of deleted;
+    # workers only ever read it through a change stream
+    try:
+        await db.create_collection("invalidation_bus", capped=True, size=INVALIDATION_BUS_SIZE_BYTES)
+    except CollectionInvalid:
+        # Created by another worker
+        pass
+
+
+# Append new migrations to the end; never reorder or edit applied ones.
+# Data migrations on large collections can be run ahead of a deploy with
+# `python migrations.py` so that workers do not run them at startup.
+MIGRATIONS = [
+    (1, "Create initial user and task indexes", create_initial_indexes),
+    (2, "Create email outbox indexes", create_email_outbox_indexes),
+    (3, "Store task assignees as ObjectId with an assignee snapshot", convert_task_assignees),
+    (4, "Create task text and user prefix search indexes", create_search_indexes),
+    (5, "Create token revocation indexes", create_revocation_indexes),
+    (6, "Store task due dates as datetimes and schedule reminders", convert_due_dates),
+    (7, "Create cache version indexes", create_cache_version_indexes),
+    (8, "Create rate limit indexes", create_rate_limit_indexes),
+    (9, "Create the task event log and daily rollup collections", create_task_history_collections),
+    (10, "Create the capped invalidation bus collection", create_invalidation_bus),
+]
+
+
+async def applied_versions(db):
+    return {doc["_id"] async for doc in db.get_collection(MIGRATIONS_COLLECTION).find({}, {"_id": 1})}
+
+
+async def apply_migrations(db=database):
+    applied = await applied_versions(db)
+    history = db.get_collection(MIGRATIONS_COLLECTION)
+
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        await migrate(db)
+        try:
+            await history.insert_one({
+                "_id": version,
+                "description": description,
+                "applied_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            # Another worker applied it concurrently; migrations are idempotent
+            pass
+    return max((version for version, _, _ in MIGRATIONS), default=0)
+
+
+# (collection, filter) pairs for the queries issued by the API routes
+ROUTE_QUERIES = [
+    ("users", {"email": "jdoe@example.com"}),
+    ("users", {"role": {"$ne": "admin"}}),
+    ("tasks", {"assigned_to": ObjectId("000000000000000000000000")}),
+    ("tasks", {"status": "completed"}),
+    ("tasks", {"status": {"$in": ["pending", "in_progress"]}}),
+    ("tasks", {"$text": {"$search": "report"}}),
+    ("users", {"search_terms": {"$regex": "^jdo"}}),
+    ("tasks", {"next_check_at": {"$lte": datetime(2026, 1, 1)}}),
+    ("tasks", {"status": {"$in": ["pending", "in_progress"]}, "due_date": {"$lt": datetime(2026, 1, 1)}}),
+    ("task_daily_rollups", {"day": {"$gte": datetime(2026, 1, 1)}}),
+]
+
+
+def _plan_stages(plan):
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_route_queries(db=database):
+    # Returns [(collection, filter, stages, uses_index)]
+    report = []
+    for collection_name, query in ROUTE_QUERIES:
+        plan = await db.get_collection(collection_name).find(query).explain()
+        stages = _plan_stages(plan["queryPlanner"]["winningPlan"])
+        uses_index = "COLLSCAN" not in stages and any(
+            stage in ("IXSCAN", "IDHACK", "COUNT_SCAN", "EXPRESS_IXSCAN") for stage in stages
+        )
+        report.append((collection_name, query, stages, uses_index))
+    return report
+
+
+async def main(explain):
+    version = await apply_migrations()
+    print(f"✅ Database at migration version {version}")
+
+    if explain:
+        all_indexed = True
+        for collection_name, query, stages, uses_index in await explain_route_queries():
+            marker = "✅" if uses_index else "❌"
+            print(f"{marker} {collection_name} {query}: {' <- '.join(s for s in stages if s)}")
+            all_indexed = all_indexed and uses_index
+        if not all_indexed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--explain", action="store_true", help="Check that route queries use an index")
+    args = parser.parse_args()
+    asyncio.run(main(args.explain))
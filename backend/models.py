@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
 class UserSchema(BaseModel):
     fullname: str = Field(...)
@@ -30,24 +30,58 @@ class UserLoginSchema(BaseModel):
             }
         }
 
+class UserUpdateSchema(BaseModel):
+    fullname: Optional[str] = None
+    email: Optional[EmailStr] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "fullname": "Jane Doe",
+                "email": "jane.doe@example.com"
+            }
+        }
+
 class TokenSchema(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None
     token_type: str = "bearer"
 
+class RefreshTokenSchema(BaseModel):
+    refresh_token: str = Field(...)
+
+# Response models describing the list endpoints. Fields are optional because
+# a subset can be requested with the fields query parameter. Emails are plain
+# str: they were validated on the way in.
 class UserResponseSchema(BaseModel):
     id: str
-    fullname: str
-    email: EmailStr
-    created_at: datetime
+    fullname: Optional[str] = None
+    email: Optional[str] = None
+    role: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+TASK_STATUSES = ["pending", "in_progress", "completed"]
+ACTIVE_STATUSES = ["pending", "in_progress"]
+
+def naive_utc(value: datetime) -> datetime:
+    # Stored datetimes are naive UTC, like datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 class TaskSchema(BaseModel):
     title: str = Field(...)
     description: str = Field(...)
     assigned_to: str = Field(...)  # user_id
-    due_date: str = Field(...)  # ISO date string
+    due_date: datetime = Field(...)  # ISO date or datetime; a date means midnight UTC
     status: str = Field(default="pending")  # pending, in_progress, completed
     priority: str = Field(default="medium")  # low, medium, high, urgent
 
+    @field_validator("due_date")
+    @classmethod
+    def due_date_utc(cls, value):
+        return naive_utc(value)
+
     class Config:
         json_schema_extra = {
             "example": {
@@ -62,3 +96,23 @@ class TaskSchema(BaseModel):
 
 class TaskUpdateSchema(BaseModel):
     status: str = Field(...)
+
+class TaskStatusUpdateSchema(BaseModel):
+    task_id: str = Field(...)
+    status: str = Field(...)
+
+class AssigneeSchema(BaseModel):
+    id: str
+    fullname: str
+    email: str
+
+class TaskResponseSchema(BaseModel):
+    id: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    assigned_to: Optional[AssigneeSchema] = None
+    due_date: Optional[str] = None
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
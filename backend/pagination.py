@@ -0,0 +1,150 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+import orjson
+from fastapi import HTTPException, Query, Response, status
+
+DEFAULT_SORT = "_id"
+SORT_FIELDS = ["_id", "created_at", "due_date"]
+MAX_PAGE_SIZE = 1000
+# Listings are always paged; clients follow X-Next-Cursor for the rest
+DEFAULT_PAGE_SIZE = 50
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size; follow X-Next-Cursor for the next page"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+        sort: str = Query(DEFAULT_SORT, description=f"One of: {SORT_FIELDS}"),
+        order: str = Query("asc", description="asc or desc")
+    ):
+        if sort not in SORT_FIELDS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid sort field. Must be one of: {SORT_FIELDS}"
+            )
+        if order not in ("asc", "desc"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid order. Must be one of: ['asc', 'desc']"
+            )
+        self.limit = limit
+        self.cursor = cursor
+        self.sort = sort
+        self.order = order
+
+
+def parse_fields(fields, allowed):
+    # "title,status" -> {"title", "status"}; None means every field
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {sorted(unknown)}. Must be among: {list(allowed)}"
+        )
+    return requested
+
+
+def combine_filters(*clauses):
+    clauses = [clause for clause in clauses if clause]
+    if not clauses:
+        return {}
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def encode_cursor(document, sort_field):
+    value = document.get(sort_field) if sort_field != "_id" else None
+    if isinstance(value, datetime):
+        encoded = {"t": "dt", "v": value.isoformat()}
+    elif value is None:
+        encoded = {"t": "null", "v": None}
+    elif isinstance(value, (int, float)):
+        encoded = {"t": "num", "v": value}
+    else:
+        encoded = {"t": "str", "v": str(value)}
+    encoded["id"] = str(document["_id"])
+    encoded["s"] = sort_field
+    raw = json.dumps(encoded, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_field):
+    invalid_cursor = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor"
+    )
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        decoded = json.loads(raw)
+        last_id = ObjectId(decoded["id"])
+        if decoded["s"] != sort_field:
+            raise invalid_cursor
+        if decoded["t"] == "dt":
+            value = datetime.fromisoformat(decoded["v"])
+        else:
+            value = decoded["v"]
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise invalid_cursor
+    return value, last_id
+
+
+def keyset_filter(sort_field, order, cursor):
+    # Documents strictly after the cursor position in (sort_field, _id) order
+    if not cursor:
+        return {}
+
+    value, last_id = decode_cursor(cursor, sort_field)
+    after = "$gt" if order == "asc" else "$lt"
+    if sort_field == "_id":
+        return {"_id": {after: last_id}}
+
+    tie = {sort_field: value, "_id": {after: last_id}}
+    if value is None:
+        # Missing values sort before everything else
+        if order == "asc":
+            return {"$or": [tie, {sort_field: {"$ne": None}}]}
+        return tie
+    if order == "asc":
+        return {"$or": [{sort_field: {"$gt": value}}, tie]}
+    return {"$or": [{sort_field: {"$lt": value}}, tie, {sort_field: None}]}
+
+
+def sort_spec(sort_field, order):
+    direction = 1 if order == "asc" else -1
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+
+async def fetch_page(collection, query, page, projection=None):
+    # Returns (documents, next_cursor). next_cursor is None on the last page.
+    query = combine_filters(query, keyset_filter(page.sort, page.order, page.cursor))
+    if projection is not None:
+        # The sort key is needed to build the next cursor
+        projection = {**projection, page.sort: 1}
+    cursor = collection.find(query, projection).sort(sort_spec(page.sort, page.order))
+
+    documents = await cursor.limit(page.limit + 1).to_list(page.limit + 1)
+    if len(documents) <= page.limit:
+        return documents, None
+    documents = documents[:page.limit]
+    return documents, encode_cursor(documents[-1], page.sort)
+
+
+def page_response(items, next_cursor):
+    # Rendered directly with orjson; returning a Response also skips FastAPI's
+    # response_model pass, which is kept for the OpenAPI schema only
+    response = Response(orjson.dumps(items), media_type="application/json")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
@@ -0,0 +1,236 @@
+import re
+from datetime import datetime, time
+
+from bson import ObjectId
+
+from database import task_collection, user_collection
+from pagination import fetch_page, encode_cursor, keyset_filter, combine_filters
+
+# Number of tasks whose assignees are fetched together in a single $in query.
+ASSIGNEE_BATCH_SIZE = 1000
+
+UNKNOWN_ASSIGNEE = {"fullname": "Unknown", "email": "Unknown"}
+
+# Results per page for search endpoints when no limit is given
+SEARCH_PAGE_SIZE = 20
+
+TASK_FIELDS = ["id", "title", "description", "assigned_to", "due_date", "status", "priority", "created_at", "updated_at"]
+USER_FIELDS = ["id", "fullname", "email", "role", "created_at"]
+
+
+def format_due_date(value):
+    # Due dates at midnight are rendered as plain dates, as they were entered
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == time() else value.isoformat()
+    return value
+
+
+def projection_for(fields):
+    # Map response fields to the Mongo projection that can produce them
+    if fields is None:
+        return None
+    projection = {field: 1 for field in fields if field != "id"}
+    if "assigned_to" in fields:
+        projection["assignee"] = 1
+    return projection
+
+
+def assignee_match(user_id):
+    # Tasks reference their assignee by ObjectId; tasks not yet converted by
+    # migration 3 still hold the id as a string
+    if ObjectId.is_valid(user_id):
+        return {"$in": [ObjectId(user_id), str(user_id)]}
+    return user_id
+
+
+def user_search_terms(fullname, email):
+    # Lowercased words of the name, the whole name and the email. Prefix
+    # searches are anchored regexes over this indexed array.
+    fullname = fullname.strip().lower()
+    return sorted(set(fullname.split()) | {fullname, email.strip().lower()})
+
+
+def user_prefix_filter(prefix):
+    return {"search_terms": {"$regex": f"^{re.escape(prefix.strip().lower())}"}}
+
+
+def assignee_snapshot(user):
+    # Denormalized onto each task so listings never read the users collection
+    return {"fullname": user["fullname"], "email": user["email"]}
+
+
+async def sync_assignee_snapshot(user, tasks=task_collection):
+    # Call whenever a user's fullname or email changes
+    await tasks.update_many(
+        {"assigned_to": assignee_match(str(user["_id"]))},
+        {"$set": {"assignee": assignee_snapshot(user)}}
+    )
+
+
+async def fetch_assignees(tasks, users=user_collection):
+    # Resolve every distinct assignee of the given tasks with one query. Only
+    # needed for tasks without an assignee snapshot.
+    ids = {str(task["assigned_to"]) for task in tasks if task.get("assigned_to")}
+    object_ids = [ObjectId(user_id) for user_id in ids if ObjectId.is_valid(user_id)]
+    if not object_ids:
+        return {}
+
+    assignees = {}
+    async for user in users.find({"_id": {"$in": object_ids}}, {"fullname": 1, "email": 1}):
+        assignees[str(user["_id"])] = user
+    return assignees
+
+
+def serialize_task(task, assignees=None, fields=None):
+    # BSON document -> TaskResponseSchema-shaped dict. Datetimes are left for
+    # the response encoder. fields=None returns the full response;
+    # assignees=None leaves assigned_to out, otherwise the task's snapshot is
+    # used and assignees is the fallback for tasks without one.
+    data = {"id": str(task["_id"])}
+
+    if fields is None or "title" in fields:
+        data["title"] = task["title"]
+    if fields is None or "description" in fields:
+        data["description"] = task["description"]
+    if assignees is not None and (fields is None or "assigned_to" in fields):
+        assigned_to = str(task["assigned_to"])
+        user = task.get("assignee") or assignees.get(assigned_to, UNKNOWN_ASSIGNEE)
+        data["assigned_to"] = {
+            "id": assigned_to,
+            "fullname": user["fullname"],
+            "email": user["email"]
+        }
+    if fields is None or "due_date" in fields:
+        data["due_date"] = format_due_date(task["due_date"])
+    if fields is None or "status" in fields:
+        data["status"] = task.get("status", "pending")
+    if fields is None or "priority" in fields:
+        data["priority"] = task.get("priority", "medium")
+    if fields is None or "created_at" in fields:
+        data["created_at"] = task.get("created_at")
+    if fields is not None and "updated_at" in fields:
+        data["updated_at"] = task.get("updated_at")
+
+    return data
+
+
+def serialize_user(user, fields=None):
+    data = {"id": str(user["_id"])}
+
+    if fields is None or "fullname" in fields:
+        data["fullname"] = user["fullname"]
+    if fields is None or "email" in fields:
+        data["email"] = user["email"]
+    if fields is None or "role" in fields:
+        data["role"] = user.get("role", "user")
+    if fields is None or "created_at" in fields:
+        data["created_at"] = user.get("created_at")
+
+    return data
+
+
+async def serialize_tasks(tasks, with_assignee=True, fields=None, users=user_collection, batch_size=ASSIGNEE_BATCH_SIZE):
+    # Tasks carry an assignee snapshot; any without one have their assignees
+    # resolved one batch at a time, len(tasks) / batch_size lookups at most
+    with_assignee = with_assignee and (fields is None or "assigned_to" in fields)
+    result = []
+    for start in range(0, len(tasks), batch_size):
+        batch = tasks[start:start + batch_size]
+        assignees = None
+        if with_assignee:
+            assignees = await fetch_assignees([task for task in batch if "assignee" not in task], users)
+        result.extend(serialize_task(task, assignees, fields) for task in batch)
+    return result
+
+
+async def list_tasks(
+    query=None,
+    page=None,
+    fields=None,
+    with_assignee=True,
+    tasks=task_collection,
+    users=user_collection
+):
+    # Returns (serialized tasks, next_cursor)
+    projection = projection_for(fields)
+    if page is None:
+        documents = await tasks.find(query or {}, projection).batch_size(ASSIGNEE_BATCH_SIZE).to_list(None)
+        next_cursor = None
+    else:
+        documents, next_cursor = await fetch_page(tasks, query or {}, page, projection)
+    return await serialize_tasks(documents, with_assignee, fields, users), next_cursor
+
+
+async def search_tasks(
+    text,
+    query=None,
+    limit=SEARCH_PAGE_SIZE,
+    cursor=None,
+    fields=None,
+    with_assignee=True,
+    tasks=task_collection,
+    users=user_collection
+):
+    # Full-text search ranked by relevance, paged by (score, _id). Returns
+    # (serialized tasks, next_cursor).
+    pipeline = [
+        {"$match": combine_filters({"$text": {"$search": text}}, query)},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if cursor:
+        pipeline.append({"$match": keyset_filter("score", "desc", cursor)})
+    pipeline.append({"$sort": {"score": -1, "_id": -1}})
+    pipeline.append({"$limit": limit + 1})
+    projection = projection_for(fields)
+    if projection is not None:
+        pipeline.append({"$project": {**projection, "score": 1}})
+
+    documents = await tasks.aggregate(pipeline).to_list(limit + 1)
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1], "score")
+    return await serialize_tasks(documents, with_assignee, fields, users), next_cursor
+
+
+async def list_users(query=None, page=None, fields=None, users=user_collection):
+    projection = projection_for(fields)
+    if page is None:
+        documents = await users.find(query or {}, projection).to_list(None)
+        next_cursor = None
+    else:
+        documents, next_cursor = await fetch_page(users, query or {}, page, projection)
+    return [serialize_user(user, fields) for user in documents], next_cursor
+
+
+async def iter_task_batches(
+    query=None,
+    fields=None,
+    with_assignee=True,
+    batch_size=ASSIGNEE_BATCH_SIZE,
+    tasks=task_collection,
+    users=user_collection
+):
+    # Streams serialized tasks in batches straight from the cursor; only one
+    # batch and its assignees are held in memory at a time
+    cursor = tasks.find(query or {}, projection_for(fields)).sort("_id", 1).batch_size(batch_size)
+    batch = []
+    async for task in cursor:
+        batch.append(task)
+        if len(batch) >= batch_size:
+            yield await serialize_tasks(batch, with_assignee, fields, users, batch_size)
+            batch = []
+    if batch:
+        yield await serialize_tasks(batch, with_assignee, fields, users, batch_size)
+
+
+async def iter_user_batches(query=None, fields=None, batch_size=ASSIGNEE_BATCH_SIZE, users=user_collection):
+    cursor = users.find(query or {}, projection_for(fields or USER_FIELDS)).sort("_id", 1).batch_size(batch_size)
+    batch = []
+    async for user in cursor:
+        batch.append(serialize_user(user, fields))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
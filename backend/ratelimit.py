@@ -0,0 +1,282 @@
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+
+import orjson
+import settings  # noqa: F401  loads .env
+from pymongo import ReturnDocument
+
+from auth import decode_token
+from database import database
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Token buckets: sustained requests per second and burst size, per client IP
+# and per authenticated user. A request takes its route's cost in tokens.
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", 20))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", 60))
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", 10))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", 40))
+# Buckets kept in memory; the least recently used are dropped, which only
+# ever refills an idle client
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# memory: each worker limits on its own. mongo: buckets are shared by all
+# workers at the cost of one round trip per bucket per request.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Proxies in front of the app that each append the address they received a
+# request from to X-Forwarded-For; 1 on Render or behind a single load
+# balancer. Set it only in a deployment that has those proxies: without them
+# every client picks its own bucket through the header. The client is the
+# entry that many places from the end; entries before it are whatever the
+# client sent. With 0 the socket peer is used, which behind a proxy puts
+# every client in the proxy's bucket unless uvicorn rewrites it
+# (--proxy-headers --forwarded-allow-ips=<proxy>).
+RATE_LIMIT_TRUSTED_PROXY_HOPS = int(os.getenv("RATE_LIMIT_TRUSTED_PROXY_HOPS", 0))
+# Requests handled at once by a worker before new ones are shed with 503
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", 256))
+
+# (method, path) -> tokens taken; everything else costs 1. Login and refresh
+# pay for a bcrypt verify or a token rotation, bulk routes and exports for
+# the work they fan out into.
+ROUTE_COSTS = {
+    ("POST", "/auth/login"): 10,
+    ("POST", "/auth/refresh"): 2,
+    ("POST", "/auth/register"): 5,
+    ("GET", "/auth/users/export"): 20,
+    ("GET", "/tasks/export"): 20,
+    ("POST", "/tasks/bulk"): 20,
+    ("PUT", "/tasks/status/bulk"): 20,
+    ("GET", "/tasks/search"): 3,
+    ("GET", "/auth/users/search"): 2,
+}
+# Long-lived streams, scrapes and health probes are neither limited nor
+# counted in flight
+EXEMPT_PREFIXES = ("/events/tasks", "/metrics", "/health/")
+
+rate_limit_collection = database.get_collection("rate_limits")
+
+
+class MemoryBuckets:
+    # Token buckets for this worker, refilled lazily when next used
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    async def take(self, key, cost, rate, burst):
+        # Returns seconds to wait before the request would be allowed, 0 if
+        # it is allowed now
+        now = self.clock()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def refund(self, key, cost, burst):
+        # Gives back tokens taken for a request that was turned away later
+        if key in self._buckets:
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (min(burst, tokens + cost), updated_at)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class MongoBuckets:
+    # The same buckets in a collection, updated atomically with a pipeline
+    # update so concurrent workers share them. Idle buckets expire through
+    # the TTL index on expires_at.
+
+    def __init__(self, collection=rate_limit_collection):
+        self.collection = collection
+
+    async def take(self, key, cost, rate, burst):
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"refilled": refilled}},
+                {"$set": {
+                    "allowed": {"$gte": ["$refilled", cost]},
+                    "tokens": {"$cond": [{"$gte": ["$refilled", cost]}, {"$subtract": ["$refilled", cost]}, "$refilled"]},
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=burst / rate)
+                }},
+                {"$unset": "refilled"}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / rate
+
+    async def refund(self, key, cost, burst):
+        await self.collection.update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [burst, {"$add": ["$tokens", cost]}]}}}]
+        )
+
+    def __len__(self):
+        return 0
+
+
+def client_ip(scope, trusted_hops=RATE_LIMIT_TRUSTED_PROXY_HOPS):
+    if trusted_hops > 0:
+        forwarded = []
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                forwarded.extend(address.strip() for address in value.decode("latin-1").split(","))
+        forwarded = [address for address in forwarded if address]
+        if forwarded:
+            return forwarded[-min(trusted_hops, len(forwarded))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def token_subject(scope):
+    # The principal a request is charged to: the user id from a valid token
+    # in the Authorization header or the token query parameter
+    token = None
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, credentials = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                token = credentials.strip()
+            break
+    if token is None and scope.get("query_string"):
+        token = (parse_qs(scope["query_string"].decode("latin-1")).get("token") or [None])[0]
+    if not token:
+        return None
+    # decode_token caches verified tokens, so the route does not pay again
+    claims = decode_token(token)
+    if claims is None:
+        return None
+    return claims.get("uid") or claims.get("sub")
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        buckets=None,
+        max_in_flight=MAX_IN_FLIGHT_REQUESTS,
+        ip_limit=(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST),
+        user_limit=(RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST),
+        enabled=RATE_LIMIT_ENABLED
+    ):
+        if buckets is None:
+            buckets = MongoBuckets() if RATE_LIMIT_BACKEND == "mongo" else MemoryBuckets()
+        self.buckets = buckets
+        self.max_in_flight = max_in_flight
+        # (tokens per second, burst)
+        self.ip_limit = ip_limit
+        self.user_limit = user_limit
+        self.enabled = enabled
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.limited_ip = 0
+        self.limited_user = 0
+        self.shed = 0
+
+    async def check(self, scope):
+        # Returns (status, retry_after) for a request to turn away, or None
+        cost = ROUTE_COSTS.get((scope["method"], scope["path"].rstrip("/") or "/"), 1)
+        ip_key = f"ip:{client_ip(scope)}"
+        wait = await self.buckets.take(ip_key, cost, *self.ip_limit)
+        if wait:
+            self.limited_ip += 1
+            return 429, wait
+        subject = token_subject(scope)
+        if subject is not None:
+            wait = await self.buckets.take(f"user:{subject}", cost, *self.user_limit)
+            if wait:
+                # Only the user's budget is spent on a request it turns away,
+                # so one busy user does not drain a shared address
+                await self.buckets.refund(ip_key, cost, self.ip_limit[1])
+                self.limited_user += 1
+                return 429, wait
+        return None
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_in_flight": self.max_in_flight,
+            "limited_ip": self.limited_ip,
+            "limited_user": self.limited_user,
+            "shed": self.shed,
+            "buckets": len(self.buckets)
+        }
+
+
+limiter = RateLimiter()
+
+
+async def _reject(send, status_code, retry_after, detail):
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    # Admission control in front of the routes: over-budget clients get 429,
+    # and once MAX_IN_FLIGHT_REQUESTS are being handled new requests get 503
+    # straight away, so queueing cannot grow latency without bound.
+
+    def __init__(self, app, limiter=limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiter
+        if (
+            scope["type"] != "http" or not limiter.enabled
+            or scope["method"] == "OPTIONS" or scope["path"].startswith(EXEMPT_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if limiter.in_flight >= limiter.max_in_flight:
+            limiter.shed += 1
+            await _reject(send, 503, 1, "Server is busy, please retry")
+            return
+
+        limiter.in_flight += 1
+        limiter.peak_in_flight = max(limiter.peak_in_flight, limiter.in_flight)
+        try:
+            try:
+                rejected = await limiter.check(scope)
+            except Exception as e:
+                # A shared backend outage must not take the API down with it
+                logger.error(f"Rate limit check failed: {e}")
+                rejected = None
+            if rejected is not None:
+                await _reject(send, rejected[0], rejected[1], "Too many requests")
+                return
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+import settings  # noqa: F401  loads .env
+from pymongo.errors import DuplicateKeyError
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+# How often each worker pulls revocations made by other workers
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 5))
+# Each sync re-reads this far back so clock skew between writers cannot
+# hide an entry
+REVOCATION_SYNC_OVERLAP = timedelta(seconds=30)
+
+revoked_collection = database.get_collection("revoked_tokens")
+
+
+def _timestamp(value):
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+class RevocationList:
+    # In-memory view of revoked_tokens consulted on every authenticated
+    # request: revoked token ids (logout, refresh rotation) and per-user
+    # cut-off times (forced sign-out). An entry is dropped once every token
+    # it covers has expired, so the set stays as small as the number of
+    # revocations in the last token lifetime. The collection's TTL index
+    # prunes the documents the same way.
+
+    def __init__(self, collection=revoked_collection):
+        self.collection = collection
+        self._tokens = {}  # jti -> expiry timestamp
+        self._users = {}  # user id -> (not_before timestamp, expiry timestamp)
+        self._synced_at = None
+        # Called with each new entry so a shared backend can forward it to
+        # the other workers ahead of their next sync
+        self._publishers = []
+
+    def is_revoked(self, claims):
+        # A stream token is revoked with the access token it was issued for
+        if claims.get("jti") in self._tokens or claims.get("sid") in self._tokens:
+            return True
+        cutoff = self._users.get(claims.get("uid"))
+        # iat has one-second resolution; a token from the same second as the
+        # sign-out is treated as older
+        return cutoff is not None and claims.get("iat", 0) <= cutoff[0]
+
+    async def revoke_token(self, jti, expires_at):
+        # Returns False if the token was already revoked, which makes
+        # single-use tokens safe across workers
+        entry = {
+            "_id": f"token:{jti}",
+            "jti": jti,
+            "expires_at": expires_at,
+            "created_at": datetime.utcnow()
+        }
+        self.apply(entry)
+        try:
+            await self.collection.insert_one(entry)
+        except DuplicateKeyError:
+            return False
+        self._publish(entry)
+        return True
+
+    async def revoke_user(self, user_id, lifetime):
+        # Every token issued to the user until now stops working
+        now = datetime.utcnow()
+        entry = {"user_id": user_id, "not_before": now, "expires_at": now + lifetime, "created_at": now}
+        self.apply(entry)
+        await self.collection.replace_one({"_id": f"user:{user_id}"}, entry, upsert=True)
+        self._publish(entry)
+
+    def apply(self, entry):
+        expires = _timestamp(entry["expires_at"])
+        if "jti" in entry:
+            self._tokens[entry["jti"]] = expires
+        else:
+            self._users[entry["user_id"]] = (int(_timestamp(entry["not_before"])), expires)
+
+    def add_publisher(self, publisher):
+        self._publishers.append(publisher)
+
+    def _publish(self, entry):
+        for publisher in self._publishers:
+            publisher(entry)
+
+    async def sync(self):
+        query = {}
+        if self._synced_at is not None:
+            query = {"created_at": {"$gte": self._synced_at - REVOCATION_SYNC_OVERLAP}}
+        async for entry in self.collection.find(query):
+            self.apply(entry)
+            if self._synced_at is None or entry["created_at"] > self._synced_at:
+                self._synced_at = entry["created_at"]
+        self._prune()
+
+    def _prune(self):
+        now = _timestamp(datetime.utcnow())
+        self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        self._users = {user_id: cutoff for user_id, cutoff in self._users.items() if cutoff[1] > now}
+
+    async def sync_periodically(self, interval=REVOCATION_SYNC_SECONDS):
+        # The first sync runs at startup, before requests are served
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Token revocation sync failed: {e}")
+
+    def stats(self):
+        return {
+            "revoked_tokens": len(self._tokens),
+            "signed_out_users": len(self._users)
+        }
+
+
+revocations = RevocationList()
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Query, Request, Response
+
+from database import analytics_user_collection
+from models import TASK_STATUSES
+from auth import get_admin_user
+from queries import assignee_match
+from history import rollup_collection, day_start, week_start
+from http_cache import versions, is_fresh, not_modified, set_cache_headers, ANALYTICS
+
+router = APIRouter()
+
+# Every endpoint here reads the daily rollups from history.py, never the raw
+# task events, so a request costs one small aggregation however many events
+# there are. Today's figures lag by up to TASK_ROLLUP_SECONDS.
+
+
+def rollup_match(since, assigned_to=None):
+    match = {"day": {"$gte": since}}
+    if assigned_to:
+        match["assigned_to"] = assignee_match(assigned_to)
+    return match
+
+
+def _hours(seconds, count):
+    return round(seconds / count / 3600, 2) if count else None
+
+
+def _conditional(request: Request, response: Response):
+    etag = versions.etag(request, ANALYTICS)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
+    return None
+
+
+@router.get("/cycle-time", response_description="Average time from creation to completion, per day")
+async def get_cycle_time(
+    request: Request,
+    response: Response,
+    days: int = Query(30, ge=1, le=366),
+    assigned_to: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    cached = _conditional(request, response)
+    if cached is not None:
+        return cached
+    since = day_start(datetime.utcnow()) - timedelta(days=days - 1)
+    group = {
+        "_id": "$day",
+        "completed": {"$sum": "$completed"},
+        "cycle_count": {"$sum": "$cycle_count"},
+        "cycle_seconds": {"$sum": "$cycle_seconds"}
+    }
+    for task_status in TASK_STATUSES:
+        group[f"{task_status}_exits"] = {"$sum": f"$time_in_status.{task_status}.exits"}
+        group[f"{task_status}_seconds"] = {"$sum": f"$time_in_status.{task_status}.seconds"}
+    rows = await rollup_collection.aggregate([
+        {"$match": rollup_match(since, assigned_to)},
+        {"$group": group},
+        {"$sort": {"_id": 1}}
+    ]).to_list(None)
+
+    totals = {key: sum(row[key] for row in rows) for key in group if key != "_id"}
+    return {
+        "since": since.date().isoformat(),
+        "completed": totals["completed"],
+        "avg_cycle_hours": _hours(totals["cycle_seconds"], totals["cycle_count"]),
+        # How long tasks stayed in each status before moving on
+        "avg_hours_in_status": {
+            task_status: _hours(totals[f"{task_status}_seconds"], totals[f"{task_status}_exits"])
+            for task_status in TASK_STATUSES
+        },
+        "days": [
+            {
+                "date": row["_id"].date().isoformat(),
+                "completed": row["completed"],
+                "avg_cycle_hours": _hours(row["cycle_seconds"], row["cycle_count"])
+            }
+            for row in rows
+        ]
+    }
+
+
+@router.get("/throughput", response_description="Tasks completed per user per week")
+async def get_throughput(
+    request: Request,
+    response: Response,
+    weeks: int = Query(12, ge=1, le=104),
+    assigned_to: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    cached = _conditional(request, response)
+    if cached is not None:
+        return cached
+    since = week_start(datetime.utcnow()) - timedelta(weeks=weeks - 1)
+    rows = await rollup_collection.aggregate([
+        {"$match": rollup_match(since, assigned_to)},
+        {"$group": {
+            "_id": {"assigned_to": "$assigned_to", "week": "$week"},
+            "completed": {"$sum": "$completed"},
+            "created": {"$sum": "$created"}
+        }}
+    ]).to_list(None)
+
+    week_labels = [(since + timedelta(weeks=i)).date().isoformat() for i in range(weeks)]
+    users = {}
+    for row in rows:
+        user = users.setdefault(str(row["_id"]["assigned_to"]), {
+            "completed": [0] * weeks,
+            "created": [0] * weeks
+        })
+        index = (row["_id"]["week"] - since).days // 7
+        user["completed"][index] += row["completed"]
+        user["created"][index] += row["created"]
+
+    names = {}
+    ids = [ObjectId(user_id) for user_id in users if ObjectId.is_valid(user_id)]
+    if ids:
+        async for user in analytics_user_collection.find({"_id": {"$in": ids}}, {"fullname": 1}):
+            names[str(user["_id"])] = user["fullname"]
+
+    result = [
+        {
+            "user_id": user_id,
+            "fullname": names.get(user_id),
+            "completed_per_week": counts["completed"],
+            "created_per_week": counts["created"],
+            "total_completed": sum(counts["completed"])
+        }
+        for user_id, counts in users.items()
+    ]
+    result.sort(key=lambda user: user["total_completed"], reverse=True)
+    return {"weeks": week_labels, "users": result}
+
+
+@router.get("/completion-trend", response_description="Tasks created and completed per day")
+async def get_completion_trend(
+    request: Request,
+    response: Response,
+    days: int = Query(30, ge=1, le=366),
+    assigned_to: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    cached = _conditional(request, response)
+    if cached is not None:
+        return cached
+    since = day_start(datetime.utcnow()) - timedelta(days=days - 1)
+    rows = await rollup_collection.aggregate([
+        {"$match": rollup_match(since, assigned_to)},
+        {"$group": {
+            "_id": "$day",
+            "created": {"$sum": "$created"},
+            "completed": {"$sum": "$completed"},
+            "reopened": {"$sum": "$reopened"}
+        }}
+    ]).to_list(None)
+    by_day = {row["_id"]: row for row in rows}
+
+    # Every day in the range, including those without activity.
+    # backlog_change is the running change in open tasks since the start.
+    trend = []
+    backlog_change = 0
+    for i in range(days):
+        day = since + timedelta(days=i)
+        row = by_day.get(day, {})
+        created = row.get("created", 0)
+        completed = row.get("completed", 0)
+        reopened = row.get("reopened", 0)
+        backlog_change += created + reopened - completed
+        trend.append({
+            "date": day.date().isoformat(),
+            "created": created,
+            "completed": completed,
+            "reopened": reopened,
+            "backlog_change": backlog_change
+        })
+    return {
+        "since": since.date().isoformat(),
+        "created": sum(day["created"] for day in trend),
+        "completed": sum(day["completed"] for day in trend),
+        "days": trend
+    }
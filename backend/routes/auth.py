@@ -1,18 +1,31 @@
-from fastapi import APIRouter, Body, HTTPException, status, Depends, BackgroundTasks
+from fastapi import APIRouter, Body, HTTPException, status, Depends, Query, Request
 from fastapi.encoders import jsonable_encoder
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Optional
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
 
-from database import user_collection, task_collection
-from models import UserSchema, UserLoginSchema
-from auth import get_hashed_password, verify_password, create_access_token, get_admin_user
+from database import user_collection, task_collection, analytics_user_collection
+from models import UserSchema, UserLoginSchema, UserUpdateSchema, UserResponseSchema, TokenSchema, RefreshTokenSchema
+from auth import (
+    hash_password_async, verify_password_async, create_token_pair, decode_token, token_expiry,
+    get_admin_user, security, REFRESH_TOKEN_EXPIRE_DAYS
+)
+from fastapi.security import HTTPAuthorizationCredentials
+from revocation import revocations
 from emails import send_credentials_email
+from cache import user_cache
+from stats import record_user_created, record_user_deleted
+from export import check_format, export_response
+from queries import list_users, iter_user_batches, assignee_match, sync_assignee_snapshot, user_search_terms, user_prefix_filter, USER_FIELDS
+from pagination import PageParams, parse_fields, combine_filters, page_response
+from http_cache import versions, is_fresh, not_modified, cached_page, USERS, TASKS, HTTP_CACHE_SETTLE_SECONDS
 
 router = APIRouter()
 
 @router.post("/register", response_description="Add new user")
 async def register_user(
-    background_tasks: BackgroundTasks,
     user: UserSchema = Body(...), 
     admin: dict = Depends(get_admin_user)
 ):
@@ -28,34 +41,83 @@ async def register_user(
     plain_password = user.password
     
     # Hash password and save user
-    user.password = get_hashed_password(user.password)
+    user.password = await hash_password_async(user.password)
     user_dict = jsonable_encoder(user)
     user_dict["created_at"] = datetime.utcnow()
+    user_dict["search_terms"] = user_search_terms(user.fullname, user.email)
     
-    await user_collection.insert_one(user_dict)
+    try:
+        await user_collection.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Registered by a concurrent request since the check above
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this email already exists"
+        )
+    user_cache.invalidate(user.email)
+    await versions.bump(USERS)
+    await record_user_created(user_dict)
     
-    # Send email in background
-    background_tasks.add_task(
-        send_credentials_email, 
-        user.email, 
-        user.fullname, 
-        plain_password
-    )
+    # Queue the email in the outbox; the dispatcher sends it
+    await send_credentials_email(user.email, user.fullname, plain_password)
     
     return {"message": "User registered successfully and credentials sent to email"}
 
-@router.get("/users", response_description="Get all users")
-async def get_all_users(admin: dict = Depends(get_admin_user)):
-    users = []
-    async for user in user_collection.find():
-        users.append({
-            "id": str(user["_id"]),
-            "fullname": user["fullname"],
-            "email": user["email"],
-            "role": user.get("role", "user"),
-            "created_at": user.get("created_at", "").isoformat() if user.get("created_at") else None
-        })
-    return users
+@router.get("/users", response_description="Get all users", response_model=List[UserResponseSchema])
+async def get_all_users(
+    request: Request,
+    role: Optional[str] = None,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {USER_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    if page.sort == "due_date":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Users cannot be sorted by due_date"
+        )
+    etag = versions.etag(request, USERS, settle=HTTP_CACHE_SETTLE_SECONDS)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    query = {"role": role} if role else {}
+    # Always project, so password hashes are never read for a listing
+    users, next_cursor = await list_users(
+        query, page, parse_fields(fields, USER_FIELDS) or USER_FIELDS, users=analytics_user_collection
+    )
+    return cached_page(users, next_cursor, etag)
+
+@router.get("/users/search", response_description="Search users by name or email prefix", response_model=List[UserResponseSchema])
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=100, description="Start of a name, a word in it, or an email"),
+    role: Optional[str] = None,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {USER_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    if page.sort == "due_date":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Users cannot be sorted by due_date"
+        )
+    query = combine_filters(user_prefix_filter(q), {"role": role} if role else None)
+    users, next_cursor = await list_users(
+        query, page, parse_fields(fields, USER_FIELDS) or USER_FIELDS, users=analytics_user_collection
+    )
+    return page_response(users, next_cursor)
+
+@router.get("/users/export", response_description="Stream all users as NDJSON or CSV")
+async def export_users(
+    role: Optional[str] = None,
+    export_format: str = Query("ndjson", alias="format", description="ndjson or csv"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {USER_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    check_format(export_format)
+    fields = parse_fields(fields, USER_FIELDS) or USER_FIELDS
+    columns = [field for field in USER_FIELDS if field in fields or field == "id"]
+    query = {"role": role} if role else {}
+    batches = iter_user_batches(query, fields, users=analytics_user_collection)
+    return export_response(batches, export_format, columns, "users")
 
 @router.post("/login", response_description="Login user")
 async def login_user(user: UserLoginSchema = Body(...)):
@@ -67,21 +129,127 @@ async def login_user(user: UserLoginSchema = Body(...)):
             detail="Incorrect email or password"
         )
     
-    if not verify_password(user.password, user_data["password"]):
+    valid, new_hash = await verify_password_async(user.password, user_data["password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password"
         )
     
+    # Transparently upgrade hashes created with an older bcrypt cost
+    if new_hash:
+        await user_collection.update_one({"_id": user_data["_id"]}, {"$set": {"password": new_hash}})
+        user_cache.invalidate(user_data["email"])
+    
     return {
-        "access_token": create_access_token(user_data["email"]),
-        "token_type": "bearer",
+        **create_token_pair(user_data),
         "user_id": str(user_data["_id"]),
         "email": user_data["email"],
         "fullname": user_data["fullname"],
         "role": user_data.get("role", "user")
     }
 
+@router.post("/refresh", response_description="Exchange a refresh token for new tokens", response_model=TokenSchema)
+async def refresh_tokens(body: RefreshTokenSchema = Body(...)):
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    claims = decode_token(body.refresh_token)
+    if claims is None or claims.get("typ") != "refresh" or revocations.is_revoked(claims):
+        raise invalid_token
+
+    # Refresh tokens are single use; revoking atomically rejects a replay,
+    # even one racing on another worker
+    if not await revocations.revoke_token(claims["jti"], token_expiry(claims)):
+        raise invalid_token
+
+    # Read the user so a changed role or a deleted account takes effect
+    try:
+        user = await user_collection.find_one({"_id": ObjectId(claims["uid"])}, {"email": 1, "role": 1})
+    except (InvalidId, KeyError):
+        raise invalid_token
+    if user is None:
+        raise invalid_token
+    return create_token_pair(user)
+
+@router.post("/logout", response_description="Revoke the current access token and optionally a refresh token")
+async def logout_user(
+    body: Optional[RefreshTokenSchema] = Body(None),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    claims = decode_token(credentials.credentials)
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if "jti" in claims:
+        await revocations.revoke_token(claims["jti"], token_expiry(claims))
+    if body is not None:
+        refresh_claims = decode_token(body.refresh_token)
+        # Only the caller's own refresh token can be revoked this way
+        if refresh_claims and refresh_claims.get("sub") == claims.get("sub") and "jti" in refresh_claims:
+            await revocations.revoke_token(refresh_claims["jti"], token_expiry(refresh_claims))
+    return {"message": "Logged out successfully"}
+
+@router.post("/users/{user_id}/sign-out", response_description="Revoke every token issued to a user")
+async def sign_out_user(user_id: str, admin: dict = Depends(get_admin_user)):
+    user = await user_collection.find_one({"_id": ObjectId(user_id)}, {"email": 1})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    await revocations.revoke_user(user_id, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    user_cache.invalidate(user["email"])
+    return {"message": "User signed out of all sessions"}
+
+@router.put("/users/{user_id}", response_description="Update a user's name or email")
+async def update_user(user_id: str, update: UserUpdateSchema = Body(...), admin: dict = Depends(get_admin_user)):
+    changes = update.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Nothing to update"
+        )
+
+    if "email" in changes:
+        existing_user = await user_collection.find_one({"email": changes["email"], "_id": {"$ne": ObjectId(user_id)}})
+        if existing_user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User with this email already exists"
+            )
+
+    previous = await user_collection.find_one({"_id": ObjectId(user_id)})
+    if not previous:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    user = {**previous, **changes}
+    changes["search_terms"] = user_search_terms(user["fullname"], user["email"])
+    try:
+        await user_collection.update_one({"_id": previous["_id"]}, {"$set": changes})
+    except DuplicateKeyError:
+        # Taken by a concurrent request since the check above
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this email already exists"
+        )
+
+    # Tasks carry a copy of the assignee's name and email
+    await sync_assignee_snapshot(user)
+    await versions.bump(USERS, TASKS)
+    user_cache.invalidate(previous["email"])
+    if "email" in changes:
+        user_cache.invalidate(changes["email"])
+    return {"message": "User updated successfully"}
+
 @router.delete("/users/{user_id}", response_description="Delete a user")
 async def delete_user(user_id: str, admin: dict = Depends(get_admin_user)):
     # Check if user exists
@@ -100,7 +268,7 @@ async def delete_user(user_id: str, admin: dict = Depends(get_admin_user)):
         )
     
     # Check if user has assigned tasks
-    tasks_count = await task_collection.count_documents({"assigned_to": user_id})
+    tasks_count = await task_collection.count_documents({"assigned_to": assignee_match(user_id)})
     if tasks_count > 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -111,6 +279,11 @@ async def delete_user(user_id: str, admin: dict = Depends(get_admin_user)):
     result = await user_collection.delete_one({"_id": ObjectId(user_id)})
     
     if result.deleted_count == 1:
+        # Revoke access right away rather than when the tokens expire
+        user_cache.invalidate(user["email"])
+        await revocations.revoke_user(user_id, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+        await record_user_deleted(user)
+        await versions.bump(USERS)
         return {"message": "User deleted successfully"}
     
     raise HTTPException(
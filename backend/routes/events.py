@@ -0,0 +1,68 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+
+from auth import authenticate_token, create_stream_token, get_stream_session, security, STREAM_TOKEN_EXPIRE_SECONDS
+from events import hub, format_sse, OVERFLOW, SIGNED_OUT, EVENT_STREAM_HEARTBEAT_SECONDS
+from health import health
+from revocation import revocations
+
+router = APIRouter()
+
+@router.post("/token", response_description="Short-lived token for opening an event stream")
+async def create_event_stream_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # EventSource cannot set headers, so browsers pass this in the URL
+    # instead of their access token
+    user, claims = await authenticate_token(credentials.credentials)
+    return {"stream_token": create_stream_token(user, claims), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@router.get("/tasks", response_description="Stream task changes as Server-Sent Events")
+async def stream_task_events(request: Request, session: tuple = Depends(get_stream_session)):
+    current_user, claims = session
+    if health.draining:
+        # The client reconnects to another worker
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Shutting down",
+            headers={"Retry-After": "1"}
+        )
+    # Admins receive every task event, other users only their own tasks
+    subscriber = hub.subscribe(str(current_user["_id"]), current_user.get("role") == "admin")
+    if subscriber is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open event streams",
+            headers={"Retry-After": "5"}
+        )
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    event = None
+                # Logout and forced sign-out also end streams already open
+                if revocations.is_revoked(claims):
+                    yield format_sse(SIGNED_OUT)
+                    break
+                if event is None:
+                    # Comment line keeps idle connections open through proxies
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+                if event is OVERFLOW:
+                    break
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
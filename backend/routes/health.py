@@ -0,0 +1,26 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from health import health
+
+router = APIRouter()
+
+
+def _probe_response(ok, reason):
+    return JSONResponse(
+        {"status": reason},
+        status_code=status.HTTP_200_OK if ok else status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Cache-Control": "no-store"}
+    )
+
+
+@router.get("/live", include_in_schema=False)
+async def liveness():
+    # For restart decisions: fails only after a prolonged database outage
+    return _probe_response(*await health.liveness())
+
+
+@router.get("/ready", include_in_schema=False)
+async def readiness():
+    # For load balancing: fails while starting, draining or without Mongo
+    return _probe_response(*await health.readiness())
@@ -0,0 +1,64 @@
+import logging
+import os
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from cache import user_cache
+from emails import dispatcher
+from events import hub
+from hashing import hash_pool
+from metrics import render_metrics, pool_monitor
+from revocation import revocations
+from scheduler import scheduler
+from http_cache import versions
+from ratelimit import limiter
+from history import history, rollups
+from health import health
+from bus import bus
+
+logger = logging.getLogger(__name__)
+
+# When set, scrapers must send it as a bearer token
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+router = APIRouter()
+
+
+def component_gauges():
+    gauges = {}
+    for prefix, stats in (
+        ("mongo_pool", pool_monitor.stats()),
+        ("user_cache", user_cache.stats()),
+        ("password_hash", hash_pool.stats()),
+        ("event_stream", hub.stats()),
+        ("email_dispatcher", dispatcher.stats()),
+        ("token_revocation", revocations.stats()),
+        ("due_date_scheduler", scheduler.stats()),
+        ("http_cache_versions", versions.stats()),
+        ("rate_limit", limiter.stats()),
+        ("task_history", history.stats()),
+        ("task_rollups", rollups.stats()),
+        ("health", health.stats()),
+        ("invalidation_bus", bus.stats()),
+    ):
+        for key, value in stats.items():
+            # Labels such as the executor kind and empty percentiles are skipped
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges[f"{prefix}_{key}"] = value
+    return gauges
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(authorization: str = Header(default="")):
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    if METRICS_TOKEN and not secrets.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    gauges = component_gauges()
+    try:
+        gauges["email_dispatcher_queue_depth"] = await dispatcher.queue_depth()
+    except Exception as e:
+        # The other gauges are still worth scraping while Mongo is down
+        logger.error(f"Email queue depth unavailable: {e}")
+    return PlainTextResponse(render_metrics(gauges), media_type="text/plain; version=0.0.4")
@@ -1,14 +1,54 @@
-from fastapi import APIRouter, Body, HTTPException, status, Depends
+from fastapi import APIRouter, Body, HTTPException, status, Depends, Query, Request, Response
 from fastapi.encoders import jsonable_encoder
-from datetime import datetime
+import json
+from datetime import datetime, time
+from typing import List, Optional
 from bson import ObjectId
 
-from database import task_collection, user_collection
-from models import TaskSchema, TaskUpdateSchema
+from database import task_collection, user_collection, analytics_task_collection, analytics_user_collection
+from models import TaskSchema, TaskUpdateSchema, TaskResponseSchema, TASK_STATUSES, ACTIVE_STATUSES, naive_utc
 from auth import get_current_user, get_admin_user
+from queries import list_tasks, search_tasks, serialize_task, fetch_assignees, iter_task_batches, assignee_match, assignee_snapshot, TASK_FIELDS, SEARCH_PAGE_SIZE
+from pagination import PageParams, parse_fields, combine_filters, page_response, MAX_PAGE_SIZE
+from stats import get_stats, workload_histogram, record_task_created, record_status_change
+from events import hub
+from scheduler import schedule_fields
+from history import history, created_event, status_event
+from http_cache import versions, is_fresh, not_modified, set_cache_headers, cached_page, user_tasks_key, TASKS, USERS, STATS, HTTP_CACHE_SETTLE_SECONDS
+from export import check_format, export_response
+from bulk import iter_request_items, iter_chunks, create_tasks_chunk, update_statuses_chunk, set_status, StatusConflict, is_ndjson, RequestStreamingResponse, NDJSON_MEDIA_TYPE
 
 router = APIRouter()
 
+def task_filters(
+    task_status: Optional[str] = Query(None, alias="status"),
+    priority: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    due_from: Optional[datetime] = Query(None, description="Earliest due date (ISO, inclusive)"),
+    due_to: Optional[datetime] = Query(None, description="Latest due date (ISO, inclusive)"),
+    overdue: Optional[bool] = Query(None, description="Only active tasks due before today, or only the others")
+):
+    query = {}
+    if task_status:
+        query["status"] = task_status
+    if priority:
+        query["priority"] = priority
+    if assigned_to:
+        query["assigned_to"] = assignee_match(assigned_to)
+    if due_from or due_to:
+        query["due_date"] = {}
+        if due_from:
+            query["due_date"]["$gte"] = naive_utc(due_from)
+        if due_to:
+            query["due_date"]["$lte"] = naive_utc(due_to)
+    if overdue is not None:
+        overdue_query = {
+            "status": {"$in": ACTIVE_STATUSES},
+            "due_date": {"$lt": datetime.combine(datetime.utcnow().date(), time())}
+        }
+        query = combine_filters(query, overdue_query if overdue else {"$nor": [overdue_query]})
+    return query
+
 @router.post("/", response_description="Create new task")
 async def create_task(task: TaskSchema = Body(...), admin: dict = Depends(get_admin_user)):
     # Verify assigned user exists
@@ -20,113 +60,208 @@ async def create_task(task: TaskSchema = Body(...), admin: dict = Depends(get_ad
         )
     
     task_dict = jsonable_encoder(task)
+    task_dict["due_date"] = task.due_date
+    task_dict.update(schedule_fields(task.due_date))
+    task_dict["assigned_to"] = user["_id"]
+    task_dict["assignee"] = assignee_snapshot(user)
     task_dict["created_at"] = datetime.utcnow()
     task_dict["created_by"] = str(admin["_id"])
     
     result = await task_collection.insert_one(task_dict)
+    await record_task_created(task_dict)
+    history.record(created_event(task_dict, str(admin["_id"])))
+    await versions.bump(TASKS, user_tasks_key(task.assigned_to))
+    hub.publish("task.created", serialize_task(task_dict, {}), task.assigned_to)
     
     return {
         "message": "Task created successfully",
         "task_id": str(result.inserted_id)
     }
 
-@router.get("/", response_description="Get all tasks")
-async def get_all_tasks(admin: dict = Depends(get_admin_user)):
-    tasks = []
-    async for task in task_collection.find():
-        # Get assigned user info
-        user = await user_collection.find_one({"_id": ObjectId(task["assigned_to"])})
-        tasks.append({
-            "id": str(task["_id"]),
-            "title": task["title"],
-            "description": task["description"],
-            "assigned_to": {
-                "id": task["assigned_to"],
-                "fullname": user["fullname"] if user else "Unknown",
-                "email": user["email"] if user else "Unknown"
-            },
-            "due_date": task["due_date"],
-            "status": task.get("status", "pending"),
-            "priority": task.get("priority", "medium"),
-            "created_at": task.get("created_at", "").isoformat() if task.get("created_at") else None
-        })
-    return tasks
+async def run_bulk(request: Request, process_chunk, user):
+    # NDJSON in, NDJSON out, one chunk at a time; JSON arrays get a summary
+    chunks = iter_chunks(iter_request_items(request))
 
-@router.get("/my", response_description="Get my tasks")
-async def get_my_tasks(current_user: dict = Depends(get_current_user)):
-    user_id = str(current_user["_id"])
-    tasks = []
-    async for task in task_collection.find({"assigned_to": user_id}):
-        tasks.append({
-            "id": str(task["_id"]),
-            "title": task["title"],
-            "description": task["description"],
-            "due_date": task["due_date"],
-            "status": task.get("status", "pending"),
-            "priority": task.get("priority", "medium"),
-            "created_at": task.get("created_at", "").isoformat() if task.get("created_at") else None
-        })
-    return tasks
+    if is_ndjson(request):
+        async def result_lines():
+            async for chunk in chunks:
+                for result in await process_chunk(chunk, user):
+                    yield json.dumps(result) + "\n"
+        return RequestStreamingResponse(result_lines(), media_type=NDJSON_MEDIA_TYPE)
 
-@router.get("/stats", response_description="Get dashboard statistics")
-async def get_dashboard_stats(admin: dict = Depends(get_admin_user)):
-    # Count total users (excluding admins)
-    total_users = await user_collection.count_documents({"role": {"$ne": "admin"}})
-    
-    # Count completed tasks
-    completed_tasks = await task_collection.count_documents({"status": "completed"})
-    
-    # Count active tasks (pending + in_progress)
-    active_tasks = await task_collection.count_documents({"status": {"$in": ["pending", "in_progress"]}})
-    
+    results = []
+    async for chunk in chunks:
+        results.extend(await process_chunk(chunk, user))
+    succeeded = sum(1 for result in results if result["ok"])
     return {
-        "total_users": total_users,
-        "completed_tasks": completed_tasks,
-        "active_tasks": active_tasks
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
     }
 
-@router.get("/completed", response_description="Get all completed tasks")
-async def get_completed_tasks(admin: dict = Depends(get_admin_user)):
-    tasks = []
-    async for task in task_collection.find({"status": "completed"}):
-        user = await user_collection.find_one({"_id": ObjectId(task["assigned_to"])})
-        tasks.append({
-            "id": str(task["_id"]),
-            "title": task["title"],
-            "description": task["description"],
-            "assigned_to": {
-                "id": task["assigned_to"],
-                "fullname": user["fullname"] if user else "Unknown",
-                "email": user["email"] if user else "Unknown"
-            },
-            "due_date": task["due_date"],
-            "status": task.get("status", "completed"),
-            "priority": task.get("priority", "medium"),
-            "created_at": task.get("created_at", "").isoformat() if task.get("created_at") else None,
-            "updated_at": task.get("updated_at", "").isoformat() if task.get("updated_at") else None
-        })
-    return tasks
-
-@router.get("/active", response_description="Get all active tasks")
-async def get_active_tasks(admin: dict = Depends(get_admin_user)):
-    tasks = []
-    async for task in task_collection.find({"status": {"$in": ["pending", "in_progress"]}}):
-        user = await user_collection.find_one({"_id": ObjectId(task["assigned_to"])})
-        tasks.append({
-            "id": str(task["_id"]),
-            "title": task["title"],
-            "description": task["description"],
-            "assigned_to": {
-                "id": task["assigned_to"],
-                "fullname": user["fullname"] if user else "Unknown",
-                "email": user["email"] if user else "Unknown"
-            },
-            "due_date": task["due_date"],
-            "status": task.get("status", "pending"),
-            "priority": task.get("priority", "medium"),
-            "created_at": task.get("created_at", "").isoformat() if task.get("created_at") else None
+@router.post("/bulk", response_description="Create many tasks")
+async def create_tasks_bulk(request: Request, admin: dict = Depends(get_admin_user)):
+    # Body: JSON array or NDJSON stream of tasks shaped like POST /tasks/
+    return await run_bulk(request, create_tasks_chunk, admin)
+
+@router.put("/status/bulk", response_description="Update the status of many tasks")
+async def update_task_status_bulk(request: Request, current_user: dict = Depends(get_current_user)):
+    # Body: JSON array or NDJSON stream of {"task_id": ..., "status": ...}
+    return await run_bulk(request, update_statuses_chunk, current_user)
+
+@router.get("/", response_description="Get all tasks", response_model=List[TaskResponseSchema])
+async def get_all_tasks(
+    request: Request,
+    filters: dict = Depends(task_filters),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {TASK_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    etag = versions.etag(request, TASKS, settle=HTTP_CACHE_SETTLE_SECONDS)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    tasks, next_cursor = await list_tasks(
+        filters, page, parse_fields(fields, TASK_FIELDS),
+        tasks=analytics_task_collection, users=analytics_user_collection
+    )
+    return cached_page(tasks, next_cursor, etag)
+
+@router.get("/search", response_description="Search tasks by title, description and assignee name", response_model=List[TaskResponseSchema])
+async def search_all_tasks(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for; \"quoted phrases\" and -excluded words are supported"),
+    filters: dict = Depends(task_filters),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {TASK_FIELDS}"),
+    current_user: dict = Depends(get_current_user)
+):
+    # Best matches first. Admins search every task, other users their own.
+    if current_user.get("role") != "admin":
+        filters = combine_filters(filters, {"assigned_to": assignee_match(str(current_user["_id"]))})
+    tasks, next_cursor = await search_tasks(
+        q, filters, limit, cursor, parse_fields(fields, TASK_FIELDS),
+        tasks=analytics_task_collection, users=analytics_user_collection
+    )
+    return page_response(tasks, next_cursor)
+
+@router.get("/export", response_description="Stream all matching tasks as NDJSON or CSV")
+async def export_tasks(
+    filters: dict = Depends(task_filters),
+    export_format: str = Query("ndjson", alias="format", description="ndjson or csv"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {TASK_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    check_format(export_format)
+    fields = parse_fields(fields, TASK_FIELDS) or TASK_FIELDS
+    columns = []
+    for field in TASK_FIELDS:
+        if field == "assigned_to" and field in fields:
+            columns += ["assigned_to_id", "assigned_to_fullname", "assigned_to_email"]
+        elif field in fields or field == "id":
+            columns.append(field)
+    batches = iter_task_batches(filters, fields, tasks=analytics_task_collection, users=analytics_user_collection)
+    return export_response(batches, export_format, columns, "tasks")
+
+@router.get("/my", response_description="Get my tasks", response_model=List[TaskResponseSchema])
+async def get_my_tasks(
+    request: Request,
+    filters: dict = Depends(task_filters),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {TASK_FIELDS}"),
+    current_user: dict = Depends(get_current_user)
+):
+    user_id = str(current_user["_id"])
+    etag = versions.etag(request, user_tasks_key(user_id))
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    query = combine_filters(filters, {"assigned_to": assignee_match(user_id)})
+    tasks, next_cursor = await list_tasks(query, page, parse_fields(fields, TASK_FIELDS), with_assignee=False)
+    return cached_page(tasks, next_cursor, etag)
+
+@router.get("/stats", response_description="Get dashboard statistics")
+async def get_dashboard_stats(
+    request: Request,
+    response: Response,
+    breakdown: bool = Query(False, description="Include per-status, per-priority, overdue and workload breakdowns"),
+    admin: dict = Depends(get_admin_user)
+):
+    etag = versions.etag(request, TASKS, USERS, STATS)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
+    # Served from incrementally maintained counters, see stats.py
+    snapshot = await get_stats()
+    by_status = snapshot.get("status", {})
+    users = snapshot.get("users", {})
+
+    result = {
+        "total_users": users.get("non_admin", 0),
+        "completed_tasks": by_status.get("completed", 0),
+        "active_tasks": sum(by_status.get(s, 0) for s in ACTIVE_STATUSES)
+    }
+    if breakdown:
+        result.update({
+            "by_status": by_status,
+            "by_priority": snapshot.get("priority", {}),
+            "overdue_tasks": snapshot.get("overdue_tasks", 0),
+            "workload_histogram": await workload_histogram(users.get("non_admin", 0)),
+            "reconciled_at": snapshot["reconciled_at"].isoformat()
         })
-    return tasks
+    return result
+
+@router.get("/completed", response_description="Get all completed tasks", response_model=List[TaskResponseSchema])
+async def get_completed_tasks(
+    request: Request,
+    filters: dict = Depends(task_filters),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {TASK_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    etag = versions.etag(request, TASKS, settle=HTTP_CACHE_SETTLE_SECONDS)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    query = combine_filters(filters, {"status": "completed"})
+    tasks, next_cursor = await list_tasks(
+        query, page, parse_fields(fields, TASK_FIELDS) or TASK_FIELDS,
+        tasks=analytics_task_collection, users=analytics_user_collection
+    )
+    return cached_page(tasks, next_cursor, etag)
+
+@router.get("/active", response_description="Get all active tasks", response_model=List[TaskResponseSchema])
+async def get_active_tasks(
+    request: Request,
+    filters: dict = Depends(task_filters),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {TASK_FIELDS}"),
+    admin: dict = Depends(get_admin_user)
+):
+    etag = versions.etag(request, TASKS, settle=HTTP_CACHE_SETTLE_SECONDS)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    query = combine_filters(filters, {"status": {"$in": ACTIVE_STATUSES}})
+    tasks, next_cursor = await list_tasks(
+        query, page, parse_fields(fields, TASK_FIELDS),
+        tasks=analytics_task_collection, users=analytics_user_collection
+    )
+    return cached_page(tasks, next_cursor, etag)
+
+@router.get("/{task_id}/history", response_description="Get the change history of a task")
+async def get_task_history(task_id: str, current_user: dict = Depends(get_current_user)):
+    task = None
+    if ObjectId.is_valid(task_id):
+        task = await task_collection.find_one({"_id": ObjectId(task_id)}, {"assigned_to": 1})
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    if str(task["assigned_to"]) != str(current_user["_id"]) and current_user.get("role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only view the history of your own tasks"
+        )
+    # Changes from the last second may still be buffered, see history.py
+    return {"task_id": task_id, "events": await history.for_task(task)}
 
 @router.put("/{task_id}/status", response_description="Update task status")
 async def update_task_status(
@@ -144,23 +279,39 @@ async def update_task_status(
     
     # Check if user is assigned to this task or is admin
     user_id = str(current_user["_id"])
-    if task["assigned_to"] != user_id and current_user.get("role") != "admin":
+    if str(task["assigned_to"]) != user_id and current_user.get("role") != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You can only update your own tasks"
         )
     
     # Update status
-    valid_statuses = ["pending", "in_progress", "completed"]
-    if task_update.status not in valid_statuses:
+    if task_update.status not in TASK_STATUSES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid status. Must be one of: {valid_statuses}"
+            detail=f"Invalid status. Must be one of: {TASK_STATUSES}"
         )
     
-    await task_collection.update_one(
-        {"_id": ObjectId(task_id)},
-        {"$set": {"status": task_update.status, "updated_at": datetime.utcnow()}}
-    )
+    # Conditional on the status read above; the returned pre-image gives
+    # the status actually replaced, and with it the scheduler fields to set
+    updated_at = datetime.utcnow()
+    try:
+        previous = await set_status(task, task_update.status, updated_at)
+    except StatusConflict:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Task is being updated by another request; retry"
+        )
+    if previous:
+        old_status = previous.get("status", "pending")
+        await record_status_change(previous, old_status, task_update.status)
+        if old_status != task_update.status:
+            history.record(status_event(previous, old_status, task_update.status, updated_at, user_id))
+        await versions.bump(TASKS, user_tasks_key(previous["assigned_to"]))
+        assigned_to = str(previous["assigned_to"])
+        if hub.has_audience(assigned_to):
+            updated = {**previous, "status": task_update.status, "updated_at": updated_at}
+            assignees = await fetch_assignees([updated] if "assignee" not in updated else [])
+            hub.publish("task.status_changed", serialize_task(updated, assignees, TASK_FIELDS), assigned_to)
     
     return {"message": "Task status updated successfully"}
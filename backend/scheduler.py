@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, time as time_of_day
+
+import settings  # noqa: F401  loads .env
+from pymongo import ASCENDING, UpdateOne
+
+from database import task_collection
+from emails import send_due_date_reminders
+from events import hub
+from lease import Lease
+from models import ACTIVE_STATUSES
+from queries import serialize_task, format_due_date
+from stats import record_tasks_overdue
+
+logger = logging.getLogger(__name__)
+
+# Reminders go out this long before the start of a task's due date
+REMINDER_LEAD_HOURS = float(os.getenv("REMINDER_LEAD_HOURS", 24))
+# Tasks handled per round trip; a sweep drains everything due in batches
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", 500))
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 10))
+# A leader that stops renewing is replaced after this long
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", 30))
+
+SWEEP_PROJECTION = {"title": 1, "due_date": 1, "status": 1, "assigned_to": 1, "assignee": 1, "next_check_at": 1}
+OVERDUE_EVENT_FIELDS = {"title", "assigned_to", "due_date", "status"}
+
+
+def overdue_at(due_date):
+    # Overdue once the due day is over, the same rule as the stats counter
+    return datetime.combine(due_date.date(), time_of_day()) + timedelta(days=1)
+
+
+def schedule_fields(due_date, reminder_sent=False):
+    # next_check_at is when the scheduler next has to look at a task: its
+    # reminder time, then the moment it becomes overdue. The sparse index on
+    # it is the scheduler's queue; tasks with nothing left to do are not in it.
+    if not isinstance(due_date, datetime):
+        return {}
+    if reminder_sent:
+        return {"next_check_at": overdue_at(due_date)}
+    return {"next_check_at": due_date - timedelta(hours=REMINDER_LEAD_HOURS)}
+
+
+def reschedule_fields(task, new_status):
+    # ($set, $unset) fields keeping a task's place in the queue in line with
+    # a status change. A reopened task is queued again, for the overdue check
+    # if its reminder already went out; one already flagged overdue stays
+    # flagged and needs nothing more. A closed task leaves the queue.
+    if new_status not in ACTIVE_STATUSES:
+        return {}, {"next_check_at": ""}
+    if task.get("status", "pending") in ACTIVE_STATUSES or "overdue_at" in task:
+        return {}, {}
+    return schedule_fields(task.get("due_date"), "reminder_sent_at" in task), {}
+
+
+class DueDateScheduler:
+    # Sends due-date reminders and flags overdue tasks. Every worker runs one,
+    # but only the lease holder sweeps.
+
+    def __init__(self, tasks=task_collection, lease=None):
+        self.tasks = tasks
+        self.lease = lease or Lease("due_date_scheduler", SCHEDULER_LEASE_SECONDS)
+        self.sweeps = 0
+        self.reminders_queued = 0
+        self.tasks_flagged = 0
+        self.last_sweep_seconds = 0.0
+        self.lag_seconds = 0.0
+
+    async def sweep_batch(self, now):
+        batch = await self.tasks.find(
+            {"next_check_at": {"$lte": now}}, SWEEP_PROJECTION
+        ).sort("next_check_at", ASCENDING).limit(SCHEDULER_BATCH_SIZE).to_list(SCHEDULER_BATCH_SIZE)
+        if not batch:
+            return 0
+        self.lag_seconds = (now - batch[0]["next_check_at"]).total_seconds()
+
+        updates = []
+        notices = {}
+        flagged = []
+        for task in batch:
+            # Conditional on the queue entry read, so a task rescheduled in
+            # the meantime is left for the next sweep
+            entry = {"_id": task["_id"], "next_check_at": task["next_check_at"]}
+            due_date = task.get("due_date")
+            if task.get("status", "pending") not in ACTIVE_STATUSES or not isinstance(due_date, datetime):
+                updates.append(UpdateOne(entry, {"$unset": {"next_check_at": ""}}))
+                continue
+            if now >= overdue_at(due_date):
+                updates.append(UpdateOne(entry, {"$set": {"overdue_at": now}, "$unset": {"next_check_at": ""}}))
+                flagged.append(task)
+                kind = "overdue"
+            else:
+                updates.append(UpdateOne(entry, {"$set": {"reminder_sent_at": now, **schedule_fields(due_date, True)}}))
+                kind = "due_soon"
+            assignee = task.get("assignee")
+            if assignee and "@" in assignee.get("email", ""):
+                notice = notices.setdefault(assignee["email"], {"fullname": assignee["fullname"], "due_soon": [], "overdue": []})
+                notice[kind].append((task["title"], format_due_date(due_date)))
+
+        if not self.lease.is_held:
+            # The lease ran out mid-batch; whoever holds it now redoes the batch
+            return 0
+        # Queued before the tasks are updated: a crash in between repeats a
+        # reminder rather than losing it
+        await send_due_date_reminders(notices)
+        await self.tasks.bulk_write(updates, ordered=False)
+        await record_tasks_overdue(len(flagged))
+
+        self.reminders_queued += sum(len(n["due_soon"]) + len(n["overdue"]) for n in notices.values())
+        self.tasks_flagged += len(flagged)
+        for task in flagged:
+            assigned_to = str(task["assigned_to"])
+            if hub.has_audience(assigned_to):
+                hub.publish("task.overdue", serialize_task(task, {}, OVERDUE_EVENT_FIELDS), assigned_to)
+        return len(batch)
+
+    async def sweep(self):
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        processed = 0
+        while self.lease.is_held:
+            count = await self.sweep_batch(now)
+            processed += count
+            if count < SCHEDULER_BATCH_SIZE:
+                break
+            # A large backlog can take longer than the lease
+            await self.lease.acquire()
+        self.sweeps += 1
+        self.last_sweep_seconds = time.perf_counter() - start
+        if processed:
+            logger.info(f"Due date sweep handled {processed} tasks in {self.last_sweep_seconds:.2f}s")
+        return processed
+
+    async def run(self, interval=SCHEDULER_POLL_SECONDS):
+        # Polls at least three times per lease so the leader renews in time
+        # and a follower notices an expired lease quickly
+        interval = min(interval, self.lease.ttl / 3)
+        try:
+            while True:
+                try:
+                    if await self.lease.acquire():
+                        await self.sweep()
+                except Exception as e:
+                    logger.error(f"Due date sweep failed: {e}")
+                await asyncio.sleep(interval)
+        finally:
+            # Lets another worker take over without waiting for expiry
+            await self.lease.release()
+
+    def stats(self):
+        return {
+            "is_leader": int(self.lease.is_held),
+            "sweeps": self.sweeps,
+            "reminders_queued": self.reminders_queued,
+            "tasks_flagged": self.tasks_flagged,
+            "last_sweep_seconds": self.last_sweep_seconds,
+            "lag_seconds": self.lag_seconds
+        }
+
+
+scheduler = DueDateScheduler()
@@ -0,0 +1,16 @@
+import asyncio
+import logging
+
+from scheduler import scheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sends due-date reminders and flags overdue tasks. Run alongside the API with
+# SCHEDULER_IN_APP=false; any number may run, only the lease holder sweeps.
+if __name__ == "__main__":
+    logger.info(f"Due date scheduler started as {scheduler.lease.holder}")
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        logger.info(f"Due date scheduler stopped: {scheduler.stats()}")
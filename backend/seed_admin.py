@@ -1,41 +1,38 @@
 import asyncio
-import os
-import motor.motor_asyncio
-from passlib.context import CryptContext
 from datetime import datetime
-from dotenv import load_dotenv
 
-load_dotenv()
-
-# Read from .env so we always connect to the right DB
-MONGO_DETAILS = os.getenv("MONGO_DETAILS", "mongodb://localhost:27017")
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_hashed_password(password: str) -> str:
-    return password_context.hash(password)
+# Connection settings come from .env via the shared factory
+from database import create_client, MONGO_DATABASE
+# Hashed and indexed for search the same way as users from /auth/register
+from auth import get_hashed_password
+from queries import user_search_terms
 
 async def create_admin():
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
-    database = client.task_manager
+    client = create_client()
+    database = client[MONGO_DATABASE]
     user_collection = database.get_collection("users")
 
     admin_email = "admin@taskmanager.com"
-    admin_user = await user_collection.find_one({"email": admin_email})
+    try:
+        admin_user = await user_collection.find_one({"email": admin_email})
 
-    if not admin_user:
-        admin_data = {
-            "fullname": "Administrator",
-            "email": admin_email,
-            "password": get_hashed_password("admin123"),
-            "role": "admin",
-            "created_at": datetime.utcnow()
-        }
-        await user_collection.insert_one(admin_data)
-        print(f"✅ Admin user created successfully!")
-        print(f"📧 Email: {admin_email}")
-        print(f"🔑 Password: admin123")
-    else:
-        print("ℹ️ Admin user already exists.")
+        if not admin_user:
+            admin_data = {
+                "fullname": "Administrator",
+                "email": admin_email,
+                "password": get_hashed_password("admin123"),
+                "role": "admin",
+                "search_terms": user_search_terms("Administrator", admin_email),
+                "created_at": datetime.utcnow()
+            }
+            await user_collection.insert_one(admin_data)
+            print(f"✅ Admin user created successfully!")
+            print(f"📧 Email: {admin_email}")
+            print(f"🔑 Password: admin123")
+        else:
+            print("ℹ️ Admin user already exists.")
+    finally:
+        client.close()
 
 if __name__ == "__main__":
     asyncio.run(create_admin())
@@ -0,0 +1,6 @@
+from dotenv import load_dotenv
+
+# Modules read their settings from the environment with os.getenv at import
+# time. They import this module first, so .env is loaded exactly once, before
+# the first of those reads, whichever module is imported first.
+load_dotenv()
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, time
+
+import settings  # noqa: F401  loads .env
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import database, task_collection, user_collection
+from models import ACTIVE_STATUSES
+from http_cache import versions, STATS
+from lease import Lease
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", 300))
+
+# One counters document for the dashboard, one workload document per assignee
+stats_collection = database.get_collection("stats")
+workload_collection = database.get_collection("user_workload")
+
+DASHBOARD_ID = "dashboard"
+
+# Active-task counts per user are bucketed into these ranges
+WORKLOAD_BUCKETS = [0, 1, 6, 11, 21]
+
+
+def _counter_key(value):
+    # Values become field names, so refuse anything Mongo would interpret
+    value = str(value)
+    if not value or "." in value or value.startswith("$"):
+        return "other"
+    return value
+
+
+async def record_tasks_created(tasks):
+    # One dashboard update plus one bulk write for any number of new tasks
+    dashboard = {}
+    workloads = {}
+    for task in tasks:
+        task_status = _counter_key(task.get("status", "pending"))
+        priority = _counter_key(task.get("priority", "medium"))
+        dashboard[f"status.{task_status}"] = dashboard.get(f"status.{task_status}", 0) + 1
+        dashboard[f"priority.{priority}"] = dashboard.get(f"priority.{priority}", 0) + 1
+        counts = workloads.setdefault(str(task["assigned_to"]), {})
+        counts[task_status] = counts.get(task_status, 0) + 1
+    await _apply_increments(dashboard, workloads)
+
+
+async def record_task_created(task):
+    await record_tasks_created([task])
+
+
+async def record_status_changes(changes):
+    # changes: [(task, old_status, new_status)], task being the pre-image
+    dashboard = {}
+    workloads = {}
+    for task, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        if "overdue_at" in task:
+            # A task the scheduler flagged is counted as overdue while it is
+            # active: completing it takes it out, reopening it puts it back
+            was_active, is_active = old_status in ACTIVE_STATUSES, new_status in ACTIVE_STATUSES
+            if was_active != is_active:
+                dashboard["overdue_tasks"] = dashboard.get("overdue_tasks", 0) + (1 if is_active else -1)
+        old_status = _counter_key(old_status)
+        new_status = _counter_key(new_status)
+        dashboard[f"status.{old_status}"] = dashboard.get(f"status.{old_status}", 0) - 1
+        dashboard[f"status.{new_status}"] = dashboard.get(f"status.{new_status}", 0) + 1
+        counts = workloads.setdefault(str(task["assigned_to"]), {})
+        counts[old_status] = counts.get(old_status, 0) - 1
+        counts[new_status] = counts.get(new_status, 0) + 1
+    await _apply_increments(dashboard, workloads)
+
+
+async def record_status_change(task, old_status, new_status):
+    await record_status_changes([(task, old_status, new_status)])
+
+
+async def record_tasks_overdue(count):
+    if count:
+        await stats_collection.update_one({"_id": DASHBOARD_ID}, {"$inc": {"overdue_tasks": count}}, upsert=True)
+        await versions.bump(STATS)
+
+
+async def _apply_increments(dashboard, workloads):
+    if dashboard:
+        await stats_collection.update_one({"_id": DASHBOARD_ID}, {"$inc": dashboard}, upsert=True)
+    if workloads:
+        await workload_collection.bulk_write(
+            [UpdateOne({"_id": user_id}, {"$inc": counts}, upsert=True) for user_id, counts in workloads.items()],
+            ordered=False
+        )
+
+
+async def record_user_created(user):
+    increments = {"users.total": 1}
+    if user.get("role") != "admin":
+        increments["users.non_admin"] = 1
+    await stats_collection.update_one({"_id": DASHBOARD_ID}, {"$inc": increments}, upsert=True)
+
+
+async def record_user_deleted(user):
+    increments = {"users.total": -1}
+    if user.get("role") != "admin":
+        increments["users.non_admin"] = -1
+    await stats_collection.update_one({"_id": DASHBOARD_ID}, {"$inc": increments}, upsert=True)
+    await workload_collection.delete_one({"_id": str(user["_id"])})
+
+
+def _deltas(prefix, computed, current):
+    # $inc fields that take the current counters to the computed ones;
+    # counters missing so far are created even at zero
+    current = current or {}
+    deltas = {}
+    for key in set(computed) | set(current):
+        delta = computed.get(key, 0) - current.get(key, 0)
+        if delta or key not in current:
+            deltas[f"{prefix}{key}"] = delta
+    return deltas
+
+
+async def reconcile():
+    # Recompute every counter from the source collections to correct drift.
+    # The correction is applied as $inc deltas against the counters read
+    # before the scans, so increments made meanwhile are kept; an update
+    # the scans also saw is counted twice until the next pass. Scans read
+    # from the primary so replication lag cannot undo recent updates.
+    current = await stats_collection.find_one({"_id": DASHBOARD_ID}) or {}
+    current_workloads = {doc.pop("_id"): doc async for doc in workload_collection.find()}
+
+    by_status = {}
+    by_priority = {}
+    workloads = {}
+    pipeline = [{"$group": {
+        "_id": {"assigned_to": "$assigned_to", "status": "$status", "priority": "$priority"},
+        "count": {"$sum": 1}
+    }}]
+    async for row in task_collection.aggregate(pipeline):
+        task_status = _counter_key(row["_id"].get("status") or "pending")
+        priority = _counter_key(row["_id"].get("priority") or "medium")
+        by_status[task_status] = by_status.get(task_status, 0) + row["count"]
+        by_priority[priority] = by_priority.get(priority, 0) + row["count"]
+        assignee = workloads.setdefault(str(row["_id"].get("assigned_to")), {})
+        assignee[task_status] = assignee.get(task_status, 0) + row["count"]
+
+    total_users = await user_collection.count_documents({})
+    non_admin_users = await user_collection.count_documents({"role": {"$ne": "admin"}})
+    # Kept up to date by the scheduler and status changes; drifts only
+    # through races with either
+    overdue_tasks = await task_collection.count_documents({
+        "status": {"$in": ACTIVE_STATUSES},
+        "due_date": {"$lt": datetime.combine(datetime.utcnow().date(), time())}
+    })
+
+    increments = {
+        **_deltas("status.", by_status, current.get("status")),
+        **_deltas("priority.", by_priority, current.get("priority")),
+        **_deltas("users.", {"total": total_users, "non_admin": non_admin_users}, current.get("users")),
+    }
+    if overdue_tasks != current.get("overdue_tasks"):
+        increments["overdue_tasks"] = overdue_tasks - current.get("overdue_tasks", 0)
+    update = {"$set": {"reconciled_at": datetime.utcnow()}}
+    if increments:
+        update["$inc"] = increments
+    try:
+        # Conditional on the pass the counters were read after, so two
+        # concurrent passes cannot both apply their correction
+        snapshot = await stats_collection.find_one_and_update(
+            {"_id": DASHBOARD_ID, "reconciled_at": current.get("reconciled_at")},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        snapshot = None
+    if snapshot is None:
+        return await stats_collection.find_one({"_id": DASHBOARD_ID})
+
+    # Users left without tasks keep a document of zeros, which counts the
+    # same as none
+    updates = []
+    for user_id in set(workloads) | set(current_workloads):
+        deltas = _deltas("", workloads.get(user_id, {}), current_workloads.get(user_id))
+        if deltas:
+            updates.append(UpdateOne({"_id": user_id}, {"$inc": deltas}, upsert=True))
+    if updates:
+        await workload_collection.bulk_write(updates, ordered=False)
+
+    await versions.bump(STATS)
+    return snapshot
+
+
+async def get_stats():
+    snapshot = await stats_collection.find_one({"_id": DASHBOARD_ID})
+    if snapshot is None or "reconciled_at" not in snapshot:
+        snapshot = await reconcile()
+    return snapshot
+
+
+async def workload_histogram(total_users):
+    # Number of users per bucket of active (pending + in_progress) tasks.
+    # Users who were never assigned a task have no workload document.
+    active_count = {"$add": [{"$ifNull": [f"${s}", 0]} for s in ACTIVE_STATUSES]}
+    pipeline = [
+        {"$project": {"active": active_count}},
+        {"$bucket": {
+            "groupBy": "$active",
+            "boundaries": WORKLOAD_BUCKETS + [float("inf")],
+            "default": "negative",
+            "output": {"users": {"$sum": 1}}
+        }}
+    ]
+    labels = {}
+    for lower, upper in zip(WORKLOAD_BUCKETS, WORKLOAD_BUCKETS[1:] + [None]):
+        if upper is None:
+            labels[lower] = f"{lower}+"
+        elif upper - lower == 1:
+            labels[lower] = str(lower)
+        else:
+            labels[lower] = f"{lower}-{upper - 1}"
+
+    histogram = {label: 0 for label in labels.values()}
+    async for row in workload_collection.aggregate(pipeline):
+        if row["_id"] in labels and row["_id"] != 0:
+            histogram[labels[row["_id"]]] = row["users"]
+    histogram[labels[0]] = max(0, total_users - sum(histogram.values()))
+    return histogram
+
+
+async def reconcile_periodically(interval=STATS_RECONCILE_SECONDS, lease=None):
+    # Every worker runs this; the lease holder does the scans
+    lease = lease or Lease("stats_reconciler", interval * 2)
+    try:
+        while True:
+            try:
+                if await lease.acquire():
+                    await reconcile()
+            except Exception as e:
+                logger.error(f"Stats reconciliation failed: {e}")
+            await asyncio.sleep(interval)
+    finally:
+        await lease.release()
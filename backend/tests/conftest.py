@@ -0,0 +1,7 @@
+from benchmarks.load_test import configure_backend
+
+# The app modules read their settings and create the Mongo client when they
+# are imported, so the in-memory backend is set up before any test runs.
+# Needs mongomock-motor, like the load test's mock backend; see
+# requirements-dev.txt.
+configure_backend("mock")
@@ -0,0 +1,58 @@
+import asyncio
+import socket
+
+import httpx
+import uvicorn
+from fastapi.testclient import TestClient
+
+import main
+import routes.events
+from auth import create_access_token
+
+
+def admin_token():
+    return create_access_token("admin@example.com", claims={"uid": "0" * 24, "role": "admin"})
+
+
+def test_stream_tokens_only_open_event_streams():
+    token = admin_token()
+    with TestClient(main.create_app()) as client:
+        # Access tokens would end up in proxy and access logs
+        assert client.get("/events/tasks", params={"token": token}).status_code == 401
+
+        response = client.post("/events/token", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        stream_token = response.json()["stream_token"]
+        assert client.get("/tasks/my", headers={"Authorization": f"Bearer {stream_token}"}).status_code == 401
+
+
+def test_logout_ends_open_event_stream(monkeypatch):
+    monkeypatch.setattr(routes.events, "EVENT_STREAM_HEARTBEAT_SECONDS", 0.1)
+
+    async def run():
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(main.create_app(), log_level="warning"))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        headers = {"Authorization": f"Bearer {admin_token()}"}
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+                response = await client.post("/events/token", headers=headers)
+                params = {"token": response.json()["stream_token"]}
+                async with client.stream("GET", "/events/tasks", params=params) as response:
+                    assert response.status_code == 200
+                    chunks = response.aiter_text()
+                    assert "retry:" in await anext(chunks)
+
+                    assert (await client.post("/auth/logout", headers=headers)).status_code == 200
+                    body = "".join([chunk async for chunk in chunks])
+            assert "event: signed_out" in body
+        finally:
+            server.should_exit = True
+            await serving
+
+    asyncio.run(run())
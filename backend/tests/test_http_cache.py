@@ -0,0 +1,17 @@
+import asyncio
+
+from starlette.requests import Request
+
+from http_cache import VersionStamps, HTTP_CACHE_SETTLE_SECONDS, TASKS
+
+
+def make_request(path):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []})
+
+
+def test_only_secondary_reads_wait_for_a_bump_to_settle():
+    versions = VersionStamps()
+    asyncio.run(versions.bump(TASKS))
+    # Primary reads already see the write
+    assert versions.etag(make_request("/tasks/my"), TASKS) is not None
+    assert versions.etag(make_request("/tasks/"), TASKS, settle=HTTP_CACHE_SETTLE_SECONDS) is None
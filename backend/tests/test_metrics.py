@@ -0,0 +1,37 @@
+from fastapi.testclient import TestClient
+
+import main
+import routes.metrics
+
+
+def request_routes(metrics_text):
+    return {
+        line.split('route="')[1].split('"')[0]
+        for line in metrics_text.splitlines()
+        if line.startswith("http_requests_total{")
+    }
+
+
+def test_routes_are_labelled_with_their_prefix():
+    with TestClient(main.create_app()) as client:
+        client.post("/auth/login", json={"email": "nobody@example.com", "password": "wrong"})
+        client.get("/tasks/")
+        client.get("/")
+        routes = request_routes(client.get("/metrics").text)
+    assert {"/auth/login", "/tasks/", "/"} <= routes
+    assert "/login" not in routes
+
+
+def test_email_queue_depth_is_exported():
+    with TestClient(main.create_app()) as client:
+        metrics = client.get("/metrics").text
+    assert any(line.startswith("email_dispatcher_queue_depth ") for line in metrics.splitlines())
+
+
+def test_metrics_token_mismatch_is_rejected(monkeypatch):
+    monkeypatch.setattr(routes.metrics, "METRICS_TOKEN", "scrape-secret")
+    with TestClient(main.create_app()) as client:
+        assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+        assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        # Non-ASCII header values must not crash the comparison
+        assert client.get("/metrics", headers={"Authorization": "Bearer café".encode("latin-1")}).status_code == 401
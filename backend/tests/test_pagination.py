@@ -0,0 +1,36 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import main
+from auth import create_access_token
+from database import task_collection
+from pagination import DEFAULT_PAGE_SIZE
+
+
+def test_listings_are_paged_by_default():
+    assignee = ObjectId()
+    asyncio.run(task_collection.insert_many([
+        {
+            "title": f"Task {i}",
+            "description": "",
+            "status": "pending",
+            "priority": "medium",
+            "due_date": datetime(2030, 1, 1),
+            "assigned_to": assignee,
+            "assignee": {"fullname": "Paged User", "email": "paged@example.com"},
+            "created_at": datetime.utcnow()
+        }
+        for i in range(DEFAULT_PAGE_SIZE + 10)
+    ]))
+    token = create_access_token("paged@example.com", claims={"uid": str(assignee), "role": "user"})
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(main.create_app()) as client:
+        first = client.get("/tasks/my", headers=headers)
+        assert len(first.json()) == DEFAULT_PAGE_SIZE
+        cursor = first.headers["X-Next-Cursor"]
+        rest = client.get("/tasks/my", headers=headers, params={"cursor": cursor})
+    assert len(rest.json()) == 10
+    assert "X-Next-Cursor" not in rest.headers
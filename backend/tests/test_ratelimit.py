@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from ratelimit import MemoryBuckets, RateLimiter, RateLimitMiddleware
+
+SERVICE_SECONDS = 0.2
+# Rejections must not wait for a slot; admitted requests must not queue
+# behind the overload
+REJECT_BOUND_SECONDS = SERVICE_SECONDS / 2
+ADMITTED_BOUND_SECONDS = SERVICE_SECONDS + 0.2
+
+
+def build_app(limiter):
+    async def work(request):
+        await asyncio.sleep(SERVICE_SECONDS)
+        return JSONResponse({"ok": True})
+
+    return RateLimitMiddleware(Starlette(routes=[Route("/tasks/", work)]), limiter)
+
+
+async def timed_get(app, address):
+    transport = httpx.ASGITransport(app=app, client=(address, 50000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        response = await client.get("/tasks/")
+        return response, time.perf_counter() - start
+
+
+def test_requests_past_max_in_flight_are_shed_immediately():
+    limiter = RateLimiter(MemoryBuckets(), max_in_flight=4, ip_limit=(1000, 1000), user_limit=(1000, 1000), enabled=True)
+    app = build_app(limiter)
+
+    async def run():
+        return await asyncio.gather(*(timed_get(app, f"10.0.0.{i}") for i in range(40)))
+
+    results = asyncio.run(run())
+    admitted = [elapsed for response, elapsed in results if response.status_code == 200]
+    shed = [(response, elapsed) for response, elapsed in results if response.status_code == 503]
+    assert len(admitted) == 4
+    assert len(shed) == 36
+    assert all(response.headers["retry-after"] == "1" for response, _ in shed)
+    assert max(elapsed for _, elapsed in shed) < REJECT_BOUND_SECONDS
+    assert max(admitted) < ADMITTED_BOUND_SECONDS
+    assert limiter.in_flight == 0
+
+
+def test_requests_past_bucket_capacity_get_429_immediately():
+    limiter = RateLimiter(MemoryBuckets(), max_in_flight=100, ip_limit=(1, 5), user_limit=(1000, 1000), enabled=True)
+    app = build_app(limiter)
+
+    async def run():
+        flood = await asyncio.gather(*(timed_get(app, "10.9.9.9") for _ in range(20)))
+        # Another address keeps its own budget
+        other = await timed_get(app, "10.0.0.1")
+        return flood, other
+
+    flood, other = asyncio.run(run())
+    admitted = [elapsed for response, elapsed in flood if response.status_code == 200]
+    limited = [(response, elapsed) for response, elapsed in flood if response.status_code == 429]
+    assert len(admitted) == 5
+    assert len(limited) == 15
+    assert all(int(response.headers["retry-after"]) >= 1 for response, _ in limited)
+    assert max(elapsed for _, elapsed in limited) < REJECT_BOUND_SECONDS
+    assert max(admitted) < ADMITTED_BOUND_SECONDS
+    assert other[0].status_code == 200
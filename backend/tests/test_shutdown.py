@@ -0,0 +1,54 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+
+import httpx
+import uvicorn
+
+import main
+from auth import create_access_token
+from health import health
+
+GRACEFUL_SHUTDOWN_SECONDS = 30
+
+
+def test_exit_signal_ends_event_streams():
+    # The open stream must not hold shutdown up until uvicorn's graceful
+    # timeout: it gets a resync event and the worker exits right away
+    async def run():
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(
+            main.create_app(), log_level="warning", timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS
+        ))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        token = create_access_token("admin@example.com", claims={"uid": "0" * 24, "role": "admin"})
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+            response = await client.post("/events/token", headers={"Authorization": f"Bearer {token}"})
+            params = {"token": response.json()["stream_token"]}
+            async with client.stream("GET", "/events/tasks", params=params) as response:
+                assert response.status_code == 200
+                chunks = response.aiter_text()
+                assert "retry:" in await anext(chunks)
+
+                start = time.monotonic()
+                os.kill(os.getpid(), signal.SIGTERM)
+                body = "".join([chunk async for chunk in chunks])
+        assert "event: resync" in body
+
+        await asyncio.wait_for(serving, GRACEFUL_SHUTDOWN_SECONDS)
+        assert time.monotonic() - start < 5
+
+    # uvicorn re-raises the signal once it has shut down
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: None)
+    try:
+        asyncio.run(run())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        health.draining = False
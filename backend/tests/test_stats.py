@@ -0,0 +1,27 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+from stats import stats_collection, record_status_changes, record_tasks_overdue, DASHBOARD_ID
+
+
+def overdue_count():
+    return asyncio.run(stats_collection.find_one({"_id": DASHBOARD_ID})).get("overdue_tasks", 0)
+
+
+def test_completing_an_overdue_task_takes_it_out_of_the_count():
+    task = {"_id": ObjectId(), "assigned_to": ObjectId(), "status": "pending", "overdue_at": datetime.utcnow()}
+    asyncio.run(record_tasks_overdue(1))
+    before = overdue_count()
+
+    asyncio.run(record_status_changes([(task, "pending", "completed")]))
+    assert overdue_count() == before - 1
+
+    reopened = {**task, "status": "completed"}
+    asyncio.run(record_status_changes([(reopened, "completed", "in_progress")]))
+    assert overdue_count() == before
+
+    # Tasks never flagged were never counted
+    asyncio.run(record_status_changes([({"_id": ObjectId(), "assigned_to": ObjectId()}, "pending", "completed")]))
+    assert overdue_count() == before